@@ -1,132 +1,250 @@
-#!/usr/bin/env python3
-import os
-import sys
-import time
-import signal
-import subprocess
-import json
-import argparse
-from pathlib import Path
-
-from TileBuilderMonitor_backend import Monitor 
-
-
-def run_backend(backend_path: Path, workdir: Path) -> int:
-    # Start backend as a subprocess and stream its output
-    proc = subprocess.Popen(
-        [sys.executable, str(backend_path)],
-        cwd=str(workdir),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        bufsize=1,
-        universal_newlines=True,
-    )
-
-    def _forward(sig, frame):
-        try:
-            proc.terminate()
-        except Exception:
-            pass
-        sys.exit(1)
-
-    for sig in (signal.SIGINT, signal.SIGTERM, getattr(signal, "SIGQUIT", None)):
-        if sig:
-            try:
-                signal.signal(sig, _forward)
-            except Exception:
-                pass
-
-    try:
-        # Print backend logs live
-        assert proc.stdout is not None
-        for line in proc.stdout:
-            print(f"[backend] {line.rstrip()}")
-    except Exception:
-        pass
-    finally:
-        proc.wait()
-    return proc.returncode
-
-
-def wait_for_file(path: Path, timeout: float | None = None) -> bool:
-    # Wait until file exists and has non-zero size; if timeout is None, wait indefinitely
-    start = time.time()
-    last_size = -1
-    while True:
-        if path.exists():
-            size = path.stat().st_size
-            if size > 0:
-                # Final small settle check to avoid catching a mid-buffer write in exotic cases
-                time.sleep(0.2)
-                size2 = path.stat().st_size
-                if size2 == size:
-                    return True
-                last_size = size2
-        if timeout is not None and (time.time() - start) > timeout:
-            return False
-        time.sleep(0.2)
-
-
-def parse_args(argv: list[str]) -> argparse.Namespace:
-    parser = argparse.ArgumentParser(
-        prog="TileBuilderMonitor",
-        description="Run TileBuilder Monitor backend and frontend",
-        add_help=True,
-    )
-    parser.add_argument("-u", "--user", dest="user", help="specify the user", default=None)
-    parser.add_argument("-r", "--run", dest="run_dir", help="run area/dir", default=None)
-    parser.add_argument("-q", "--qor",action="store_true", help="include QOR summary", default=False) 
-    return parser.parse_args(argv)
-
-
-def main():
-    root = Path(__file__).resolve().parent
-    backend = root / "TileBuilderMonitor_backend.py"
-    frontend = root / "TileBuilderMonitor_frontend.py"
-    out_dir = root / "tmp_TileBuilderMonitor" / Monitor.getUser()
-    out_file = out_dir / "tmp.json"
-    inputs_file = out_dir / "inputs.json"
-
-    # Ensure fresh output directory
-    out_dir.mkdir(parents=True, exist_ok=True)
-    if out_file.exists():
-        try:
-            out_file.unlink()
-        except Exception:
-            pass
-
-    # Parse CLI args and write inputs.json so other tools can discover them
-    args = parse_args(sys.argv[1:])
-    print(f"{args=}")
-    
-    try:
-        payload = {"user": args.user, "run_dir": args.run_dir, "qor": args.qor}
-        # Only include keys with values, or include both? Keep both keys for stability
-        with inputs_file.open("w", encoding="utf-8") as f:
-            json.dump(payload, f, indent=2)
-    except Exception as e:
-        print(f"[orchestrator] Failed to write inputs.json: {e}")
-
-    print("[orchestrator] Starting backend...")
-    rc = run_backend(backend, root)
-    if rc != 0:
-        print(f"[orchestrator] Backend exited with code {rc}. Aborting.")
-        sys.exit(rc)
-
-    print("[orchestrator] Backend finished. Verifying output file...")
-    if not wait_for_file(out_file, timeout=10):
-        print(f"[orchestrator] Output file not found or empty: {out_file}")
-        sys.exit(1)
-
-    print("[orchestrator] Launching frontend...")
-    # Run frontend as a separate process so its Tk mainloop owns the process
-    try:
-        subprocess.run([sys.executable, str(frontend)], cwd=str(root), check=True)
-    except subprocess.CalledProcessError as e:
-        print(f"[orchestrator] Frontend exited with code {e.returncode}")
-        sys.exit(e.returncode)
-
-
-if __name__ == "__main__":
+#!/usr/bin/env python3
+import os
+import sys
+import time
+import signal
+import subprocess
+import json
+import argparse
+import queue
+import threading
+from pathlib import Path
+
+from TileBuilderMonitor_common import getUser, inputsName, outDir, snapshotName
+from TileBuilderMonitor_stream import StreamClient, socketPath
+
+inprocessCloseTimeout = 10   # seconds closing the window gives an --inprocess backend to wind down
+guiNotifyTimeout = 5         # seconds we try to reach the GUI to tell it a failed backend is gone
+
+
+def run_backend(backend_path: Path, workdir: Path) -> int:
+    # Start backend as a subprocess and stream its output
+    proc = subprocess.Popen(
+        [sys.executable, str(backend_path)],
+        cwd=str(workdir),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1,
+        universal_newlines=True,
+    )
+
+    def _forward(sig, frame):
+        try:
+            proc.terminate()
+        except Exception:
+            pass
+        sys.exit(1)
+
+    for sig in (signal.SIGINT, signal.SIGTERM, getattr(signal, "SIGQUIT", None)):
+        if sig:
+            try:
+                signal.signal(sig, _forward)
+            except Exception:
+                pass
+
+    try:
+        # Print backend logs live
+        assert proc.stdout is not None
+        for line in proc.stdout:
+            print(f"[backend] {line.rstrip()}")
+    except Exception:
+        pass
+    finally:
+        proc.wait()
+    return proc.returncode
+
+
+def run_inprocess(root: Path, inputs: dict) -> int:
+    # Backend on a worker thread , GUI on the main thread , records handed over on a queue drained with root.after
+    # Saves two interpreter start-ups and the tmp.json write/parse before anything shows up
+    os.chdir(root)  # backend paths are relative to the checkout, same as the subprocess cwd
+    from TileBuilderMonitor_backend import Monitor
+    from TileBuilderMonitor_frontend import TileBuilderMonitorApp
+    import TileBuilderMonitor_sessions as sessions
+
+    messages: queue.Queue = queue.Queue()
+    cancelled = threading.Event()
+
+    def sink(message: dict):
+        if message.get("type") == "run":
+            # The backend keeps filling in its own record (QoR link), the GUI gets a snapshot of it
+            message = {"type": "run", "record": dict(message["record"])}
+        messages.put(message)
+
+    def work():
+        try:
+            monitor = Monitor(sink=sink, inputs=inputs)
+            if cancelled.is_set():
+                return  # closed half way, a partial snapshot would read as runs disappearing in events.jsonl / history
+            monitor.WriteToJson()  # still written so events.jsonl / history / later runs keep working
+            monitor.writeProfile()
+        except BaseException as e:  # lookupRecords / getUser exit(1), that is a SystemExit
+            print(f"[orchestrator] Backend failed: {e!r}")
+            messages.put({"type": "closed"})
+
+    def close():
+        # Window closed or SIGINT/SIGTERM: kill the backend's shells so running serascmd / fc_shell jobs stop and
+        # queued ones fail fast, then give the thread a bounded moment before the frontend exits the process
+        cancelled.set()
+        sessions.pool.cancel()
+        worker.join(inprocessCloseTimeout)
+        if worker.is_alive():
+            print(f"[orchestrator] Backend still busy after {inprocessCloseTimeout}s, exiting without it")
+
+    worker = threading.Thread(target=work, name="tbm-backend", daemon=True)
+    worker.start()
+    app = TileBuilderMonitorApp(messages=messages, on_close=close)
+    app.run()
+    close()
+    return 0
+
+
+def end_gui_stream(sock_path: str, gui: subprocess.Popen):
+    # The backend failed , maybe before it ever connected , so the GUI would wait on "(loading...)" forever
+    # A closed message ends its stream like a backend that went away , if we can't reach it either it is closed
+    if gui.poll() is not None:
+        return
+    try:
+        client = StreamClient(sock_path, timeout=guiNotifyTimeout)
+        client.send({"type": "closed"})
+        client.close()
+    except OSError as e:
+        print(f"[orchestrator] Could not reach the frontend ({e}), closing it")
+        gui.terminate()
+
+
+def wait_for_file(path: Path, timeout: float | None = None) -> bool:
+    # Wait until file exists and has non-zero size; if timeout is None, wait indefinitely
+    # The backend writes the snapshot aside and renames it into place, so once it exists it is complete
+    start = time.time()
+    while True:
+        try:
+            if path.stat().st_size > 0:
+                return True
+        except FileNotFoundError:
+            pass
+        if timeout is not None and (time.time() - start) > timeout:
+            return False
+        time.sleep(0.2)
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="TileBuilderMonitor",
+        description="Run TileBuilder Monitor backend and frontend",
+        add_help=True,
+    )
+    parser.add_argument("-u", "--user", dest="user", help="users to monitor , comma separated names or globs", default=None)
+    parser.add_argument("-r", "--run", dest="run_dir", help="runs to monitor , a file of entries or comma separated entries : run dirs , dir/ prefixes , globs , tile: label: nick: filters", default=None)
+    parser.add_argument("-q", "--qor",action="store_true", help="include QOR summary", default=False) 
+    parser.add_argument("--nfs-jobs", dest="nfs_jobs", type=int, help="max concurrent params.json/NFS reads", default=None)
+    parser.add_argument("--seras-jobs", dest="seras_jobs", type=int, help="max concurrent serascmd queries", default=None)
+    parser.add_argument("--fc-jobs", dest="fc_jobs", type=int, help="max concurrent fc_shell jobs", default=None)
+    parser.add_argument("--qor-timeout", dest="qor_timeout", type=int, help="seconds before a compare_qor_data job is killed", default=None)
+    parser.add_argument("--engine", choices=["threads", "async"], help="backend engine , async streams runs as they complete", default="threads")
+    parser.add_argument("--no-stream", dest="no_stream", action="store_true", help="wait for the backend to finish before opening the GUI", default=False)
+    parser.add_argument("--shared-cache", dest="shared_cache", help="cache directory shared with the team for serascmd status and params", default=None)
+    parser.add_argument("--shared-ttl", dest="shared_ttl", type=int, help="seconds a shared cache entry stays good", default=None)
+    parser.add_argument("--workers", type=int, help="split the backend over N worker processes by FLOW_DIR", default=1)
+    parser.add_argument("--transport-cmd", dest="transport_cmd", help="shell template that starts a worker , see TileBuilderMonitor_coordinator", default=None)
+    parser.add_argument("--hosts", help="comma separated hosts for {host} in --transport-cmd", default=None)
+    parser.add_argument("--inprocess", action="store_true", help="run the backend on a thread inside the GUI process instead of as subprocesses", default=False)
+    parser.add_argument("--current-users", dest="current_users", help="current_users.json to read instead of the site one", default=None)
+    parser.add_argument("--profile", action="store_true", help="record timing spans , writes trace.json (chrome://tracing) and a per stage summary", default=False)
+    return parser.parse_args(argv)
+
+
+def main():
+    root = Path(__file__).resolve().parent
+    backend = root / "TileBuilderMonitor_backend.py"
+    coordinator = root / "TileBuilderMonitor_coordinator.py"
+    frontend = root / "TileBuilderMonitor_frontend.py"
+    user = getUser()
+    out_dir = Path(outDir(user, root))
+    out_file = out_dir / snapshotName
+    inputs_file = out_dir / inputsName
+
+    # Ensure fresh output directory , the last snapshot is kept as tmp.prev.json so the backend can diff against it
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if out_file.exists():
+        try:
+            out_file.replace(out_dir / "tmp.prev.json")
+        except Exception:
+            pass
+
+    # Parse CLI args and write inputs.json so other tools can discover them
+    args = parse_args(sys.argv[1:])
+    print(f"{args=}")
+    if args.workers > 1:
+        if args.inprocess:
+            print("[orchestrator] --workers needs separate processes , ignoring --inprocess")
+            args.inprocess = False
+        backend = coordinator  # looks up the runs , shards them over the workers and merges their snapshots
+    
+    try:
+        payload = {
+            "user": args.user,
+            "run_dir": os.path.abspath(args.run_dir) if args.run_dir and os.path.isfile(args.run_dir) else args.run_dir,   # the backend runs from the checkout
+            "qor": args.qor,
+            "nfs_jobs": args.nfs_jobs,
+            "seras_jobs": args.seras_jobs,
+            "fc_jobs": args.fc_jobs,
+            "engine": args.engine,
+            "qor_timeout": args.qor_timeout,
+            "stream": None if (args.no_stream or args.inprocess) else socketPath(user),
+            "shared_cache": os.path.abspath(args.shared_cache) if args.shared_cache else None,
+            "shared_ttl": args.shared_ttl,
+            "workers": args.workers,
+            "transport_cmd": args.transport_cmd,
+            "hosts": args.hosts,
+            "profile": args.profile,
+            "current_users": os.path.abspath(args.current_users) if args.current_users else None,
+        }
+        # Only include keys with values, or include both? Keep both keys for stability
+        with inputs_file.open("w", encoding="utf-8") as f:
+            json.dump(payload, f, indent=2)
+    except Exception as e:
+        print(f"[orchestrator] Failed to write inputs.json: {e}")
+
+    if args.inprocess:
+        print("[orchestrator] Running backend and frontend in process...")
+        sys.exit(run_inprocess(root, payload))
+
+    if not args.no_stream:
+        # Frontend first , it listens on the socket and fills in runs as the backend sends them
+        sock_path = socketPath(user)
+        print("[orchestrator] Launching frontend...")
+        gui = subprocess.Popen([sys.executable, str(frontend), "--stream", sock_path], cwd=str(root))
+        print("[orchestrator] Starting backend...")
+        rc = run_backend(backend, root)
+        if rc != 0:
+            print(f"[orchestrator] Backend exited with code {rc}. The GUI may show partial results.")
+            end_gui_stream(sock_path, gui)
+        gui.wait()
+        if gui.returncode:
+            print(f"[orchestrator] Frontend exited with code {gui.returncode}")
+        sys.exit(gui.returncode)
+
+    print("[orchestrator] Starting backend...")
+    rc = run_backend(backend, root)
+    if rc != 0:
+        print(f"[orchestrator] Backend exited with code {rc}. Aborting.")
+        sys.exit(rc)
+
+    print("[orchestrator] Backend finished. Verifying output file...")
+    if not wait_for_file(out_file, timeout=10):
+        print(f"[orchestrator] Output file not found or empty: {out_file}")
+        sys.exit(1)
+
+    print("[orchestrator] Launching frontend...")
+    # Run frontend as a separate process so its Tk mainloop owns the process
+    try:
+        subprocess.run([sys.executable, str(frontend)], cwd=str(root), check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"[orchestrator] Frontend exited with code {e.returncode}")
+        sys.exit(e.returncode)
+
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
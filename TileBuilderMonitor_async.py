@@ -0,0 +1,202 @@
+import asyncio
+from collections import defaultdict
+
+import os
+import signal
+
+from TileBuilderMonitor_backend import (
+    Run, WorkSpace, parseStatusLine, qorCommand, qorManifest, qorUpToDate, saveQoRManifest, serasQuery, statusTargets,
+)
+from TileBuilderMonitor_scheduler import defaultLimits
+from TileBuilderMonitor_snapshot import statusUnknown
+import TileBuilderMonitor_trace as trace
+
+
+# asyncio engine for the backend , picked with --engine async
+# Every run is its own coroutine : params.json is read off the event loop , then it waits on the serascmd query
+# for its TB_SRV_DIR (started by whichever run gets there first) and is yielded as soon as that is back ,
+# so one slow workspace no longer holds up the rest
+
+Verbose = False
+streamLimit = 16 * 1024 * 1024   # longest serascmd line we read , asyncio's own 64KiB is less than some report rows
+
+
+class AsyncEngine():
+    def __init__(self, monitor):
+        self.monitor = monitor
+        self.inputs = monitor.inputs
+        self.limits = dict(defaultLimits)
+        for lane in self.limits:
+            if self.inputs.get(f"{lane}_jobs"):
+                self.limits[lane] = max(1, int(self.inputs[f"{lane}_jobs"]))
+        self.lanes = {}
+        self.serverTasks = {}   # TB_SRV_DIR -> task giving {basedir name: [(status, Target)]}
+        self.wanted = None      # basedir names of every run we monitor , serascmd rows for anything else are dropped
+
+    def run(self, records):
+        return asyncio.run(self.collect(records))
+
+    async def collect(self, records):
+        workspaceDict = defaultdict(list)   # FLOW_DIR -> [runs]
+        async for run in self.runs(records):
+            if Verbose:
+                print(f"Run ready: {run.dictionary['basedir']}")
+            if run.dictionary["FLOW_DIR"] not in workspaceDict:
+                self.monitor.emit({"type": "workspace", "FLOW_DIR": run.dictionary["FLOW_DIR"], "state": "loading"})
+            workspaceDict[run.dictionary["FLOW_DIR"]].append(run)
+            self.monitor.emitRuns([run])
+        workspaces = [WorkSpace(self.monitor, flow_dir, runs) for flow_dir, runs in workspaceDict.items()]
+        if self.inputs.get("qor", False):
+            await self.qor(workspaces)
+        for workspace in workspaces:
+            if self.inputs.get("qor", False):
+                self.monitor.emitRuns(workspace.validRuns)   # again , now with their QoR links
+            self.monitor.emit({"type": "workspace", "FLOW_DIR": workspace.FLOW_DIR, "state": "done"})
+        return workspaces
+
+    async def runs(self, records):
+        # Yields each Run as soon as its params and status are known
+        # a server's query starts before all its runs are known , so rows are filtered on every basedir name we monitor
+        self.wanted = {data["basedir"].split("/")[-1] for data in records if data.get("basedir")}
+        self.lanes = {lane: asyncio.Semaphore(limit) for lane, limit in self.limits.items()}
+        tasks = [asyncio.create_task(self.buildRun(data)) for data in records]
+        for next_run in asyncio.as_completed(tasks):
+            run = await next_run
+            if run is not None:
+                yield run
+
+    async def buildRun(self, data):
+        try:
+            async with self.lanes["nfs"]:
+                run = await asyncio.to_thread(Run, data, self.monitor)
+            if not run.validityFlag:
+                return None
+            if "TB_SRV_DIR" not in run.dictionary:
+                print(f"TB_SRV_DIR not found in dictionary for: {run.dictionary.get('basedir')}")
+                return run
+            try:
+                rows = await self.rowsFor(run.dictionary["TB_SRV_DIR"])
+            except Exception as e:   # the run still goes in the snapshot , just without a status we trust
+                print(f"Error occurred while querying {run.dictionary['TB_SRV_DIR']}: {e}")
+                rows = None
+            if rows is None:   # serascmd failed , flagged so the snapshot diff and history leave its targets alone
+                run.dictionary[statusUnknown] = True
+                return run
+            for status, Target in rows.get(run.dictionary["basedir"].split("/")[-1], ()):
+                run.dictionary[statusTargets[status]].append(Target)
+            return run
+        except Exception as e:
+            print(f"Error occurred while building run {data.get('basedir')}: {e}")
+            return None
+
+    def rowsFor(self, tb_srv_dir):
+        # one query per server no matter how many runs ask for it
+        if tb_srv_dir not in self.serverTasks:
+            self.serverTasks[tb_srv_dir] = asyncio.ensure_future(self.queryServer(tb_srv_dir))
+        return self.serverTasks[tb_srv_dir]
+
+    async def queryServer(self, tb_srv_dir):
+        # basedir name -> [(status, Target)] , None if serascmd failed
+        rows = defaultdict(list)
+        with trace.span("getStatus", server=tb_srv_dir, shared=self.monitor.sharedCache is not None):
+            server_rows = await self.sharedRows(tb_srv_dir)
+            if server_rows is None:
+                return None
+            for Target, base_dir, status in server_rows:
+                rows[base_dir].append((status, Target))
+        return rows
+
+    async def sharedRows(self, tb_srv_dir):
+        # serverRows through the team's shared cache , getOrCompute (and its lock) runs in a thread
+        # and hands the query itself back to the event loop
+        shared = self.monitor.sharedCache
+        if shared is None:
+            return await self.serverRows(tb_srv_dir, self.wanted)
+        loop = asyncio.get_running_loop()
+
+        def compute():
+            return asyncio.run_coroutine_threadsafe(self.serverRows(tb_srv_dir), loop).result()
+
+        return await asyncio.to_thread(shared.getOrCompute, "status", tb_srv_dir, compute)
+
+    async def serverRows(self, tb_srv_dir, wanted=None):
+        # [Target, basedir name, status] for every RUNNING/FAILED row on the server (of the basedir names in wanted) ,
+        # None if serascmd couldn't run
+        rows = []
+        cmd = f"source {tb_srv_dir}/.cshrc; serascmd -find_jobs '{serasQuery}' -report 'name dir status'"
+        async with self.lanes["seras"]:
+            with trace.span("serascmd", server=tb_srv_dir) as span:
+                try:
+                    proc = await asyncio.create_subprocess_exec(
+                        "tcsh", "-c", cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+                        limit=streamLimit,
+                    )
+                except OSError as e:
+                    print(f"serascmd failed for {tb_srv_dir}: {e}")
+                    span.set(error=str(e))
+                    return None
+                try:
+                    async for line in proc.stdout:
+                        row = parseStatusLine(line.decode(errors="replace"), wanted)
+                        if row is not None:
+                            rows.append(list(row))
+                except Exception as e:   # e.g. a line over streamLimit , the rows we have are not the whole picture
+                    print(f"serascmd failed for {tb_srv_dir}: {e}")
+                    span.set(error=str(e))
+                    if proc.returncode is None:
+                        proc.kill()
+                    await proc.wait()
+                    return None
+                status = await proc.wait()
+                span.set(status=status, rows=len(rows))
+        if status != 0:   # whatever it printed is not the whole picture , never cached
+            print(f"serascmd failed for {tb_srv_dir}: exited with status {status}")
+            return None
+        return rows
+
+    async def qor(self, workspaces):
+        jobs = []
+        for workspace in workspaces:
+            tile_map = defaultdict(list)
+            for run in workspace.validRuns:
+                tile_map[run.dictionary["tilename"]].append(run)
+            jobs.extend(self.tileQoR(workspace, tile) for tile in tile_map.values())
+        for result in await asyncio.gather(*jobs, return_exceptions=True):
+            if isinstance(result, Exception):
+                print(f"Error occurred: {result}")
+
+    async def tileQoR(self, workspace, tile):
+        async with self.lanes["fc"]:
+            with trace.span("compare_qor_data", workspace=workspace.FLOW_DIR, tilename=tile[0].dictionary.get("tilename"), runs=len(tile)) as span:
+                status = await self.compareQoR(workspace, tile)
+                span.set(status=status)
+                return status
+
+    async def compareQoR(self, workspace, tile):
+        # tileQoR holds the fc lane
+        qor = await asyncio.to_thread(workspace.qorInputs, tile)   # isdir probing is NFS too , keep it off the loop
+        if not qor["locations"]:
+            return None
+        manifest = await asyncio.to_thread(qorManifest, qor)
+        if qorUpToDate(qor["output"], manifest):
+            return 0
+        proc = await asyncio.create_subprocess_exec(
+            "tcsh", "-c", f"module load {qor['fc_module']}; fc_shell -x '{qorCommand(qor)}'",
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+            start_new_session=True,   # so a timeout takes fc_shell down with the shell
+        )
+        try:
+            status = await asyncio.wait_for(proc.wait(), self.monitor.qorTimeout)
+        except asyncio.TimeoutError:
+            print(f"compare_qor_data for {qor['output']} timed out after {self.monitor.qorTimeout}s")
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+            await proc.wait()
+            return None
+        if status == 0:
+            saveQoRManifest(qor["output"], manifest)
+        else:
+            print(f"compare_qor_data for {qor['output']} failed with return code {status}")
+        return status
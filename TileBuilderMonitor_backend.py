@@ -1,282 +1,585 @@
-import cmd
-from concurrent import futures
-import subprocess
-import json
-from pathlib import Path
-import os
-import re
-import time
-from tkinter.tix import STATUS
-from unittest import result
-from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
-from collections import defaultdict
- 
-
-currentUsers_path = "/tool/aticad/1.0/flow/current_users.json"
-
-
-paramsNeeded = ["TECHNO_NAME","FLOW_DIR","TB_SRV_DIR","FC_MODULE"]
-
-Verbose = False # for ERRORS and debugging
-
-#The monitor class will hold all run details , it will be the entirety of the program , For Gui I plan to add a gui method 
-#We currently have a basic structure in place, but it needs to be expanded with more functionality and edgecases
-#such as seeing synced flowdir and pdk as techdir
-
-# a few changes To propose / add are
-# use seras cmd for each run dir rather than one flow directory
-# switch back to threadpool executor
-
-
-
-class Monitor():
-    
-    def __init__(self):
-        self.validWorkSpaces = []
-        self.validRuns = []
-        self.currentUser = self.getUser()
-        self.inputs = self.getInput()
-        self.usersToMonitor , self.runsToMonitor = self.getToMonitor()
-        self.getWorkSpaces()
-
-
-    @staticmethod
-    def getUser():
-        try:
-            result = subprocess.run(["printenv", "USER"], text=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            user = result.stdout.strip()
-            return user
-        except subprocess.CalledProcessError as e:
-            print("printenv command failed:", e.stderr.strip())
-            exit(1)
-
-    def getInput(self):
-        with open(f"tmp_TileBuilderMonitor/{self.currentUser}/inputs.json", 'r') as file:
-            return json.load(file)
-
-    def getToMonitor(self):
-        users = []
-        runs = []
-        if self.inputs.get("user", None):
-            print(f"Monitoring for user: {self.inputs['user']}")
-            users = self.inputs['user'].split(",")
-        else:
-            print("Monitoring Current user Only")
-            users.append(self.currentUser)
-
-        if self.inputs.get("run_dir", None):
-            with open(self.inputs['run_dir'], 'r') as file:
-                for line in file:
-
-                    runs.append(line.strip())
-        else:
-            print("Monitoring runs for Current user")
-
-        return users , runs    
-                
-    def getWorkSpaces(self):
-        print("Getting workspaces...")
-        workspaceDict = defaultdict(list)   # Needed this to get be able to add keys that dont exist yet , not sure why but it was a COPILOT Fix
-        if not os.path.exists(currentUsers_path):
-            print("File not found.")
-            exit(1)
-        else:
-            with open(currentUsers_path, 'r') as file: 
-                for line in file:
-                    data = json.loads(line)
-                    if data["username"] in self.usersToMonitor or data["basedir"] in self.runsToMonitor:  # only get workspaces for users we care about
-                        try:
-                            params_path = os.path.join(data["basedir"], "params.json")
-                            with open(params_path, 'r') as params_file:
-                                params = json.load(params_file)
-                                workspaceDict[params["params"]["FLOW_DIR"]].append(data)   # adding the json object of the run to the list of that flowdir
-                        except FileNotFoundError:
-                            print(f"File not found: {params_path}")
-                        except PermissionError as e:
-                            print(f"PermissionError: {e} while accessing {params_path}")
-
-                start_time = time.time()
-                with ThreadPoolExecutor() as executor:
-                    results = list(executor.map(lambda flow_dir: WorkSpace(self, flow_dir , workspaceDict ), workspaceDict.keys()))  # this is where we create the workspace objects , one for each flowdir
-                    #FLAG , Maybe don't send in the whole dict , just the list of runs for that flowdir , workspaceDict[flow_dir] rather than worksapceDict 
-                    self.validWorkSpaces.extend(results) # add all the workspace objects to the monitor object
-                print(f"\nFound {len(self.validWorkSpaces)} WorkSpaces found for user: {self.currentUser}\n")
-                end_time = time.time()
-                elapsed_time = end_time - start_time
-                print(f"Time taken to get workspaces: {elapsed_time:.2f} seconds") #everything done to create workspaces and runs in the worksspace is done in the init so I'm timing the creation of all objects
-
-    def WriteToJson(self):
-        print("Writing to Json")
-        os.makedirs(f"tmp_TileBuilderMonitor/{self.currentUser}", exist_ok=True)
-        with open(f"tmp_TileBuilderMonitor/{self.currentUser}/tmp.json", 'w') as file:
-            for workspace in self.validWorkSpaces:
-                for run in workspace.validRuns:
-                    if run.validityFlag:
-                        file.write(json.dumps(run.dictionary, indent=4))
-                                   
-class WorkSpace():
-    def __init__(self, monitor, flow_dir , workspaceDict):
-            self.FLOW_DIR = flow_dir
-            self.inputs = monitor.inputs
-            self.validRuns= self.getRuns(workspaceDict)
-            self.getStatus()
-            if self.inputs.get("qor", False):  # Check if 'qor' key exists and is True
-                self.getQoRSummary()
-            print(f"Initialized WorkSpace for FLOW_DIR: {flow_dir}\n\n")
-
-    def getRuns(self, workspaceDict):
-            with ThreadPoolExecutor() as executor:
-                jobs_submitted = [executor.submit(Run, run_dict, self) for run_dict in workspaceDict[self.FLOW_DIR]] # create a Run object for each run in the workspace based on how many json objects we have for that flowdir
-                return [job.result() for job in as_completed(jobs_submitted)]
-
-    def printRuns(self):
-        for run in self.validRuns:
-            print(f"Run: {run.dictionary}\n\n")
-
-    def getStatus(self):
-
-        run_map = {run.dictionary["basedir"].split("/")[-1]:run for run in self.validRuns if "basedir" in run.dictionary}  # map of basedir to run object for easy access to map targets to the correct run object in seras cmd output , output looks like
-                                                                                                                            # TargetName ../../basedir , Alot faster to map the targets to runs than using the command for every run object 
-            
-        if "TB_SRV_DIR" in self.validRuns[0].dictionary:
-            for status in ["RUNNING","FAILED"]: # Sources enviornmental variables for that flowdir and spits out all jobs with that status in that workspace
-                cmd = f"""
-                source {self.validRuns[0].dictionary['TB_SRV_DIR']}/.cshrc;   
-                serascmd -find_jobs 'status=={status} ' -report 'name dir';
-                """
-                result = subprocess.run(['tcsh', '-c', cmd], text=True, capture_output=True)
-                for line in result.stdout.splitlines():
-                    parts = line.split()
-                    if len(parts) == 2:
-                        Target = parts[0]
-                        base_dir = parts[1].split("/")[-1]
-
-                        ansi_escape = re.compile(
-                        r'(?:\x1B[@-_][0-?]*[ -/]*[@-~])'  # ANSI CSI sequences
-                        r'|(?:\x1B\][^\x07]*\x07)'         # OSC sequences
-                        )
-                        # I beleive serascmd is givng me these escape sequences that are visible when Im saving to json
-                        # This is only seen after json.dump() , lowkey makes me want to reformat everything and avoid json
-                        Target = ansi_escape.sub('', Target)
-                        
-                        try:
-                            if status == "RUNNING":
-                                run_map[base_dir].dictionary["RUNNING_TARGETS"].append(Target)
-                            else:
-                                run_map[base_dir].dictionary["FAILED_TARGETS"].append(Target)
-                        except KeyError:
-                            if Verbose:
-                                print(f"KeyError: {base_dir} not found in run_map")  # Runs that don't share the same flowdir are sometimes technically in the same workspace , for example if we use --newflow when branching 
-                                print(f"Available keys: {list(run_map.keys())}") # these runs will show up when using seras cmd for that workspace , but we dont have them in our run_map as theya re different flowdirs so this causes a keyerror
-                            continue
-
-
-            self.validRuns = list(run_map.values())
-            return self.validRuns
-
-        else:
-            print(f"TB_SRV_DIR not found in dictionary for: {self.dictionary['basedir']}")
-
-    def getQoRSummary(self):
-                         
-        futures = []
-        processes = []
-        
-        tile_map = defaultdict(list)  # map of tile to run object for easy access when doing qor summary
-        for run in self.validRuns:
-            tile_map[run.dictionary["tilename"]].append(run)  # assuming tilename is a key in the run dictionary
-
-        for tile in tile_map.values():
-            location_list = []
-            names_str = ""
-            fc_module = tile[0].dictionary["FC_MODULE"]
-            for run in tile:
-                output = f"tmp_TileBuilderMonitor/{tile[0].dictionary['label']}/{tile[0].dictionary['tilename']}"
-                full_path = os.path.abspath(os.path.join( output , 'index.html'))
-                try:
-                    if not os.path.isdir(os.path.join(os.path.abspath(run.dictionary["basedir"]), "data","PlaceQorData")):
-                        if not os.path.isdir(os.path.join(os.path.abspath(run.dictionary["basedir"]), "data","PrePlaceQorData")):
-                            if not os.path.isdir(os.path.join(os.path.abspath(run.dictionary["basedir"]), "data","SynthesizeQorData")):
-                                    print(f"Could not find QOR data for {run.dictionary['nickname']} in {run.dictionary['basedir']}")
-                                    continue
-                            else :
-                                location_list.append(os.path.join(os.path.abspath(run.dictionary["basedir"]), "data", "SynthesizeQorData"))
-                        else :
-                            location_list.append(os.path.join(os.path.abspath(run.dictionary["basedir"]), "data", "PrePlaceQorData"))
-                    else :
-                        location_list.append(os.path.join(os.path.abspath(run.dictionary["basedir"]), "data", "PlaceQorData"))
-
-                    names_str += f"{run.dictionary['nickname']} "         
-                except Exception as e:
-                    print(f"Error occurred while processing run {run.dictionary['nickname']}: {e}")
-
-                run.dictionary["link"] = f"https://logviewer-atl.amd.com{full_path}"    
-            locations_str = " ".join([location for location in location_list])
-            command = f'compare_qor_data -force -run_locations "{locations_str}" -run_names "{names_str}" -output {output}; exit'
-
-        #     processes.append(subprocess.Popen(["tcsh", "-c", f"module load {fc_module}; fc_shell -x '{command}'"], text=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE))
-        # for process in processes:
-        #     try:
-        #         stdout, stderr = process.communicate()
-        #         if process.returncode == 0:
-        #             # if Verbose:
-        #             print(f"Process completed successfully:\n{stdout}\n")
-        #         else:
-        #             print(f"Process failed with return code {process.returncode}:\n{stderr}\n")
-        #     except Exception as e:
-        #         print(f"Error occurred while waiting for process: {e}")     
-
-                     
-
-            with ProcessPoolExecutor() as executor:
-                futures.append(executor.submit(subprocess.run, ["tcsh", "-c", f"module load {fc_module}; fc_shell -x '{command}'"], text=True, capture_output=True))
-
-        for future in futures:
-            try:
-                result = future.result()
-            except Exception as e:
-                print(f"Error occurred: {e}")
-
-
-       
-
-  
-class Run():
-    def __init__(self,json,workSpace):
-        self.dictionary = json
-        self.validityFlag = True
-        self.ACTIVE = False
-        self.ERROR = False
-        self.getParams()
-        self.dictionary["RUNNING_TARGETS"] = []
-        self.dictionary["FAILED_TARGETS"] = []
-        self.dictionary["link"] = []
-
-    def getParams(self):
-        try:
-            params_path = os.path.join(self.dictionary["basedir"], "params.json")
-            
-            with open(params_path, 'r') as params_file:   # load params.json and get needed parameters 
-                params = json.load(params_file)
-                for parameter in paramsNeeded:
-                    self.dictionary[parameter] = params["params"][parameter] # tounge twiser might change 
-
-    
-        except FileNotFoundError:
-            print(f"File not found: {params_path}")
-            self.validityFlag = False   
-
-
-
-def main():
-
-   TileBuilderMonitor = Monitor()
-   TileBuilderMonitor.WriteToJson()    
-
-if __name__ == "__main__":
-    main()
-
-# changs to make , get flowdir from p4 rather than json 
-# get techno from pdk dir path 
-# run faster please 
-
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from collections import defaultdict
+
+from TileBuilderMonitor_index import CurrentUsersIndex
+from TileBuilderMonitor_cache import ParamsCache, QoRStageIndex, SharedCache, sharedTTL
+import TileBuilderMonitor_sessions as sessions
+from TileBuilderMonitor_scheduler import Scheduler
+from TileBuilderMonitor_snapshot import appendEvents, carryStatus, diffSnapshots, readSnapshot, statusUnknown, writeSnapshot
+from TileBuilderMonitor_common import getUser
+from TileBuilderMonitor_selector import Selector, readEntries
+import TileBuilderMonitor_trace as trace
+ 
+
+currentUsers_path = "/tool/aticad/1.0/flow/current_users.json"
+currentUsersIndex_path = "tmp_TileBuilderMonitor/current_users_index"  # meta.json + per user segments , shared by everyone running from this checkout , only depends on current_users.json
+
+
+paramsNeeded = ["TECHNO_NAME","FLOW_DIR","TB_SRV_DIR","FC_MODULE"]
+
+# One serascmd per TB_SRV_DIR for both statuses , rows come back as name dir status
+serasQuery = "status==RUNNING || status==FAILED"
+statusTargets = {"RUNNING": "RUNNING_TARGETS", "FAILED": "FAILED_TARGETS"}
+statusSuffixes = tuple(statusTargets)
+
+# serascmd colours its output , strip it before splitting or the escapes end up in the json
+ansiEscape = re.compile(
+    r'(?:\x1B[@-_][0-?]*[ -/]*[@-~])'  # ANSI CSI sequences
+    r'|(?:\x1B\][^\x07]*\x07)'         # OSC sequences
+)
+
+qorTimeout = 1800   # seconds before a compare_qor_data job is killed , --qor-timeout
+qorManifestName = ".qor_inputs.json"   # written next to index.html , the QorData dirs and mtimes that produced it
+qorStagePreference = ["PlaceQorData", "PrePlaceQorData", "SynthesizeQorData"]   # newest first , compare_qor_data gets the first one a run has
+
+Verbose = False # for ERRORS and debugging
+
+#The monitor class will hold all run details , it will be the entirety of the program , For Gui I plan to add a gui method 
+#We currently have a basic structure in place, but it needs to be expanded with more functionality and edgecases
+#such as seeing synced flowdir and pdk as techdir
+
+# a few changes To propose / add are
+# use seras cmd for each run dir rather than one flow directory
+# switch back to threadpool executor
+
+
+
+class Monitor():
+    
+    def __init__(self, sink=None, inputs=None):
+        self.validWorkSpaces = []
+        self.validRuns = []
+        self.currentUser = self.getUser()
+        self.inputs = inputs if inputs is not None else self.getInput()   # --inprocess hands them over directly
+        if self.inputs.get("profile"):
+            trace.enable()
+        self.sink = sink   # gets workspace/run/done messages as work completes , see TileBuilderMonitor_stream
+        self.stream = None
+        self.streamFailed = False
+        self.previous = None   # last snapshot's records , read the first time a run with a failed query is streamed
+        if self.sink is None and self.inputs.get("stream"):
+            from TileBuilderMonitor_stream import StreamClient   # only needed when the GUI is listening
+            try:
+                self.stream = StreamClient(self.inputs["stream"])
+                self.sink = self.stream.send
+            except OSError as e:   # results still go to tmp.json , main() exits non zero so the orchestrator ends the GUI
+                print(f"Could not connect to the frontend at {self.inputs['stream']}: {e}")
+                self.streamFailed = True
+            if not self.inputs.get("stream_done", True):
+                self.emit({"type": "worker"})   # coordinator worker , the frontend waits for the coordinator , not for us
+        self.selector = self.getToMonitor()   # -u / -r compiled , see TileBuilderMonitor_selector
+        self.sharedCache = None   # serascmd rows and params shared with the rest of the team , --shared-cache
+        if self.inputs.get("shared_cache"):
+            self.sharedCache = SharedCache(self.inputs["shared_cache"], self.inputs.get("shared_ttl") or sharedTTL)
+        self.paramsCache = ParamsCache(f"tmp_TileBuilderMonitor/{self.currentUser}/params_cache.json", paramsNeeded, shared=self.sharedCache)  # one cache for Monitor and every Run , saves the second params.json read
+        self.paramsCache.load()
+        self.qorTimeout = self.inputs.get("qor_timeout") or qorTimeout
+        self.scheduler = Scheduler({lane: self.inputs.get(f"{lane}_jobs") for lane in ("nfs", "seras", "fc")})  # one set of limits for every thread and subprocess we start
+        self.qorStages = QoRStageIndex(f"tmp_TileBuilderMonitor/{self.currentUser}/qor_stage_index.json")
+        if self.inputs.get("qor", False):
+            self.qorStages.load()
+        self.getWorkSpaces()
+        if self.inputs.get("stream_done", True):
+            self.emit({"type": "done", "runs": sum(len(workspace.validRuns) for workspace in self.validWorkSpaces)})
+        else:
+            self.emit({"type": "detach"})   # coordinator worker , the coordinator says done once every shard is merged
+        if self.inputs.get("save_caches", True):   # a coordinator worker leaves them to the coordinator
+            self.paramsCache.save()
+            self.qorStages.save()
+        print(self.paramsCache.summary())
+        if self.sharedCache is not None:
+            print(self.sharedCache.summary())
+
+    def emit(self, message):
+        if self.sink is None:
+            return
+        try:
+            self.sink(message)
+        except Exception as e:
+            print(f"Stopped streaming to the frontend: {e}")
+            self.sink = None
+
+    def emitRuns(self, runs):
+        for run in runs:
+            if run.validityFlag:
+                record = run.dictionary
+                if record.get(statusUnknown):   # what tmp.json will have , the last known targets , still flagged
+                    if self.previous is None:
+                        self.previous = previousSnapshot(f"tmp_TileBuilderMonitor/{self.currentUser}")
+                    record = carryStatus(self.previous, [record])[0]
+                self.emit({"type": "run", "record": record})
+
+    def closeStream(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+    getUser = staticmethod(getUser)
+
+    def getInput(self):
+        with open(f"tmp_TileBuilderMonitor/{self.currentUser}/inputs.json", 'r') as file:
+            return json.load(file)
+
+    def getToMonitor(self):
+        return toMonitor(self.inputs, self.currentUser)
+                
+    def getWorkSpaces(self):
+        print("Getting workspaces...")
+        # parse , the index hands us only the lines for the users/runs we care about , rather than json.loads on the whole site's file
+        # a coordinator worker is handed its shard of those lines in inputs instead
+        records = self.inputs.get("records")
+        if records is None:
+            records = lookupRecords(self.selector, self.inputs.get("current_users"))
+
+        start_time = time.time()
+        with trace.span("getWorkSpaces", engine=self.inputs.get("engine") or "threads", runs=len(records)):
+            if self.inputs.get("engine") == "async":
+                from TileBuilderMonitor_async import AsyncEngine
+                self.validWorkSpaces.extend(AsyncEngine(self).run(records))
+            else:
+                self.getWorkSpacesThreaded(records)
+            self.scheduler.shutdown()
+
+        print(f"\nFound {len(self.validWorkSpaces)} WorkSpaces found for user: {self.currentUser}\n")
+        end_time = time.time()
+        elapsed_time = end_time - start_time
+        print(f"Time taken to get workspaces: {elapsed_time:.2f} seconds") # params , status and QoR for every workspace
+
+    def getWorkSpacesThreaded(self, records):
+        # params , one Run per line , the params.json reads are limited by the nfs lane
+        # status , one serascmd per TB_SRV_DIR , submitted as soon as the first run on that server has its params
+        # rather than after all of them , the rows are kept for the basedir names of every record we were handed
+        wanted = {data["basedir"].split("/")[-1] for data in records if data.get("basedir")}
+        queries = {}   # TB_SRV_DIR -> future of serverStatus
+        lock = threading.Lock()
+
+        def buildRun(data):
+            # the query is registered inside the nfs task , so it is in queries before the run's future is done
+            # (a done callback runs after result() waiters wake up and could miss the collectStatus below)
+            run = Run(data, self)
+            server = run.dictionary.get("TB_SRV_DIR") if run.validityFlag else None
+            if server is not None:
+                with lock:
+                    if server not in queries:
+                        queries[server] = self.scheduler.submit("seras", serverStatus, server, wanted, self.sharedCache)
+            return run
+
+        runJobs = [self.scheduler.submit("nfs", buildRun, data) for data in records]
+
+        # grouping still needs every run , a workspace (and a tile's QoR) is only complete once all params are read
+        workspaceDict = defaultdict(list)   # FLOW_DIR -> [runs]
+        for run in self.scheduler.wait(runJobs):
+            if run.validityFlag:
+                workspaceDict[run.dictionary["FLOW_DIR"]].append(run)
+        self.validWorkSpaces.extend(WorkSpace(self, flow_dir, runs) for flow_dir, runs in workspaceDict.items())
+        for workspace in self.validWorkSpaces:
+            self.emit({"type": "workspace", "FLOW_DIR": workspace.FLOW_DIR, "state": "loading"})
+
+        # rows onto runs once both the query and the runs are in , flowdirs that share a server share the query
+        with lock:
+            queries = dict(queries)
+        statusJobs = collectStatus([run for workspace in self.validWorkSpaces for run in workspace.validRuns], self.scheduler, self.sharedCache, queries)
+        # QoR , each tile goes as soon as the status of its server is in
+        qorJobs = {}
+        for workspace in self.validWorkSpaces:
+            qorJobs[workspace] = workspace.getQoRSummary(statusJobs) if self.inputs.get("qor", False) else []
+        streamed = self.streamProgress(statusJobs, qorJobs) if self.sink is not None else []
+        self.scheduler.wait(list(statusJobs.values()) + [job for jobs in qorJobs.values() for job in jobs] + streamed)
+
+    def streamProgress(self, statusJobs, qorJobs):
+        # A run goes to the frontend as soon as the query for its server is back ,
+        # a workspace is done once all of its servers and QoR jobs are , returns a future per workspace for that
+        streamed = []
+        for workspace in self.validWorkSpaces:
+            by_server = defaultdict(list)
+            for run in workspace.validRuns:
+                by_server[run.dictionary.get("TB_SRV_DIR")].append(run)
+            for server, runs in by_server.items():
+                job = statusJobs.get(server)
+                if job is None:
+                    self.emitRuns(runs)
+                else:
+                    job.add_done_callback(lambda _, runs=runs: self.emitRuns(runs))
+
+            finished = Future()
+            streamed.append(finished)
+
+            def workspaceDone(workspace=workspace, finished=finished):
+                if qorJobs[workspace]:
+                    self.emitRuns(workspace.validRuns)   # again , now with their QoR links
+                self.emit({"type": "workspace", "FLOW_DIR": workspace.FLOW_DIR, "state": "done"})
+                finished.set_result(None)
+
+            jobs = [statusJobs[server] for server in by_server if server in statusJobs] + qorJobs[workspace]
+            Scheduler.whenAll(jobs, workspaceDone)
+        return streamed
+
+    def snapshotRecords(self):
+        return [run.dictionary for workspace in self.validWorkSpaces for run in workspace.validRuns if run.validityFlag]
+
+    def WriteToJson(self):
+        print("Writing to Json")
+        with trace.span("WriteToJson"):
+            writeResults(f"tmp_TileBuilderMonitor/{self.currentUser}", self.snapshotRecords())
+
+    def writeProfile(self, out_dir=None, extra_events=()):
+        # --profile , trace.json (chrome://tracing / Perfetto) and the per stage summary
+        if not trace.enabled:
+            return
+        out_dir = out_dir or f"tmp_TileBuilderMonitor/{self.currentUser}"
+        print(trace.write(out_dir, extra_events))
+        print(f"Trace written to {os.path.join(out_dir, trace.traceName)}")
+                                   
+def toMonitor(inputs, currentUser):
+    # Selector for the runs to monitor from the orchestrator inputs
+    # user , comma separated names or globs , run_dir , a file of -r entries or the entries themselves (dirs , prefixes , globs , tile:/label:/nick:)
+    users = []
+    if inputs.get("user", None):
+        print(f"Monitoring for user: {inputs['user']}")
+        users = [user.strip() for user in inputs['user'].split(",") if user.strip()]
+    else:
+        print("Monitoring Current user Only")
+        users.append(currentUser)
+
+    runs = readEntries(inputs.get("run_dir", None))
+    if not runs:
+        print("Monitoring runs for Current user")
+
+    return Selector(users, runs)
+
+
+def lookupRecords(selector, current_users=None):
+    # current_users.json entries the selector picks , through the sidecar index
+    # current_users overrides the site file (inputs "current_users") , e.g. for the synthetic fixtures in TileBuilderMonitor_bench_fixture
+    current_users = current_users or currentUsers_path
+    if not os.path.exists(current_users):
+        print("File not found.")
+        exit(1)
+    users, runs = selector.exactUsers(), selector.exactBasedirs()
+    with trace.span("current_users", users=len(users), basedirs=len(runs), scan=selector.needsScan()) as span:
+        index = CurrentUsersIndex(current_users, currentUsersIndex_path)
+        records = index.lookup(users, runs, selector)
+        span.set(records=len(records))
+    return records
+
+
+def previousSnapshot(out_dir):
+    # the orchestrator moves the last snapshot aside to tmp.prev.json , when run on its own the old tmp.json is still there
+    out_path = f"{out_dir}/tmp.json"
+    return readSnapshot(out_path) if os.path.exists(out_path) else readSnapshot(f"{out_dir}/tmp.prev.json")
+
+
+def writeResults(out_dir, records):
+    # Snapshot , change events and history for one set of run records , returns the records as written
+    os.makedirs(out_dir, exist_ok=True)
+    out_path = f"{out_dir}/tmp.json"
+    previous = previousSnapshot(out_dir)
+    ts = time.time()
+    records = carryStatus(previous, records)   # runs whose serascmd failed keep their last known targets , flagged
+    writeSnapshot(out_path, records, ts)   # NDJSON with a header , renamed into place when complete
+    events = diffSnapshots(previous, records, ts)
+    appendEvents(out_dir, events, len(records), ts)
+    print(f"{len(events)} changes since the last snapshot")
+    try:
+        from TileBuilderMonitor_history import historyName, recordSnapshot   # sqlite3 only once there is something to record
+        recordSnapshot(f"{out_dir}/{historyName}", records, ts)   # only changed states get rows
+    except Exception as e:   # history is nice to have , never worth losing the snapshot over
+        print(f"Could not record history: {e}")
+    return records
+
+
+class WorkSpace():
+    def __init__(self, monitor, flow_dir , runs):
+            self.FLOW_DIR = flow_dir
+            self.monitor = monitor
+            self.inputs = monitor.inputs
+            self.validRuns = runs   # runs are built by Monitor on the scheduler , status and QoR get filled in after
+            print(f"Initialized WorkSpace for FLOW_DIR: {flow_dir}\n\n")
+
+    def getQoRSummary(self, statusJobs=None):
+        # Submits one compare_qor_data per tile on the fc lane , returns the futures
+        statusJobs = statusJobs or {}
+        tile_map = defaultdict(list)  # map of tile to run object for easy access when doing qor summary
+        for run in self.validRuns:
+            tile_map[run.dictionary["tilename"]].append(run)  # assuming tilename is a key in the run dictionary
+
+        futures = []
+        for tile in tile_map.values():
+            after = {statusJobs.get(run.dictionary.get("TB_SRV_DIR")) for run in tile}
+            futures.append(self.monitor.scheduler.submit("fc", self.tileQoR, tile, after=after))
+        return futures
+
+    def tileQoR(self, tile):
+        with trace.span("compare_qor_data", workspace=self.FLOW_DIR, tilename=tile[0].dictionary.get("tilename"), runs=len(tile)) as span:
+            status = self.compareQoR(tile)
+            span.set(status=status)
+            return status
+
+    def compareQoR(self, tile):
+        qor = self.qorInputs(tile)
+        if not qor["locations"]:
+            return None
+        manifest = qorManifest(qor)
+        if qorUpToDate(qor["output"], manifest):   # same QorData dirs with the same mtimes as the run that wrote index.html
+            if Verbose:
+                print(f"QoR for {qor['output']} is up to date , skipping compare_qor_data")
+            return 0
+        key, setup = sessions.fcKey(qor["fc_module"])   # module load happens once per FC_MODULE , not once per tile
+        timeout = self.monitor.qorTimeout
+        try:
+            status, output = sessions.pool.run(key, setup, f"fc_shell -x '{qorCommand(qor)}'", timeout=timeout)
+        except TimeoutError:
+            print(f"compare_qor_data for {qor['output']} timed out after {timeout}s")
+            return None
+        if status == 0:
+            saveQoRManifest(qor["output"], manifest)
+        else:
+            print(f"compare_qor_data for {qor['output']} failed with return code {status}:\n{output}\n")
+        return status
+
+    def qorInputs(self, tile):
+        # QorData dirs , run names and output dir for one tile's compare_qor_data
+        location_list = []
+        names_str = ""
+        fc_module = tile[0].dictionary["FC_MODULE"]
+        output = f"tmp_TileBuilderMonitor/{tile[0].dictionary['label']}/{tile[0].dictionary['tilename']}"
+        for run in tile:
+            full_path = os.path.abspath(os.path.join( output , 'index.html'))
+            try:
+                stages = self.monitor.qorStages.stages(run.dictionary["basedir"])   # one scandir of data/ , cached across refreshes
+                run.dictionary["QOR_STAGES"] = sorted(stages)
+                stage = next((stage for stage in qorStagePreference if stage in stages), None)
+                if stage is None:
+                    print(f"Could not find QOR data for {run.dictionary['nickname']} in {run.dictionary['basedir']}")
+                    continue
+                location_list.append(os.path.join(os.path.abspath(run.dictionary["basedir"]), "data", stage))
+
+                names_str += f"{run.dictionary['nickname']} "         
+            except Exception as e:
+                print(f"Error occurred while processing run {run.dictionary['nickname']}: {e}")
+
+            run.dictionary["link"] = f"https://logviewer-atl.amd.com{full_path}"    
+        return {"fc_module": fc_module, "locations": location_list, "names": names_str, "output": output}
+
+
+def qorCommand(qor):
+    locations_str = " ".join([location for location in qor["locations"]])
+    return f'compare_qor_data -force -run_locations "{locations_str}" -run_names "{qor["names"]}" -output {qor["output"]}; exit'
+
+
+def qorManifest(qor):
+    # what compare_qor_data was fed , if none of it changed there is no point running it again
+    mtimes = {}
+    for location in qor["locations"]:
+        try:
+            mtimes[location] = os.stat(location).st_mtime
+        except OSError:
+            mtimes[location] = None
+    return {"names": qor["names"], "fc_module": qor["fc_module"], "locations": mtimes}
+
+
+def qorUpToDate(output, manifest):
+    if None in manifest["locations"].values() or not os.path.exists(os.path.join(output, "index.html")):
+        return False
+    try:
+        with open(os.path.join(output, qorManifestName), 'r') as file:
+            return json.load(file) == manifest
+    except (OSError, json.JSONDecodeError):
+        return False
+
+
+def saveQoRManifest(output, manifest):
+    try:
+        with open(os.path.join(output, qorManifestName), 'w') as file:
+            json.dump(manifest, file, indent=2)
+    except OSError as e:
+        print(f"Could not save QoR manifest in {output}: {e}")
+
+
+def collectStatus(runs, scheduler, shared=None, queries=None):
+    # Group runs by TB_SRV_DIR and ask each server once , then route the rows to every run it belongs to
+    # serascmd only gives us ../../basedir so runs are matched on the last dir name within their server
+    # queries , TB_SRV_DIR -> future of a serverStatus already in flight , those rows are attached once it is back
+    servers = defaultdict(lambda: defaultdict(list))   # TB_SRV_DIR -> basedir name -> [runs]
+    for run in runs:
+        if not run.validityFlag:
+            continue
+        if "TB_SRV_DIR" not in run.dictionary:
+            print(f"TB_SRV_DIR not found in dictionary for: {run.dictionary.get('basedir')}")
+            continue
+        servers[run.dictionary["TB_SRV_DIR"]][run.dictionary["basedir"].split("/")[-1]].append(run)
+
+    jobs = {}   # TB_SRV_DIR -> future
+    for server, run_map in servers.items():
+        query = (queries or {}).get(server)
+        if query is None:
+            jobs[server] = scheduler.submit("seras", queryServer, server, run_map, shared)
+        else:
+            jobs[server] = scheduler.submit("seras", attachQuery, server, query, run_map, after=[query])
+    return jobs
+
+
+class SerascmdError(sessions.SessionError):
+    pass
+
+
+def statusRows(tb_srv_dir, wanted=None):
+    # Yields (Target, basedir name, status) as serascmd prints them , only for basedir names in wanted if given
+    # The report is read line by line off the session and never held whole , busy servers list thousands of jobs
+    # that aren't ours , so memory stays flat however long it is
+    # Raises SessionError / TimeoutError / OSError if serascmd couldn't run , SerascmdError (a SessionError) after
+    # the last row if it exited non zero , callers collect the rows before using them so a failed query counts as failed
+    key, setup = sessions.tbKey(tb_srv_dir)   # warm shell with .cshrc already sourced , only the query itself costs anything
+    with trace.span("serascmd", server=tb_srv_dir) as span:
+        rows = 0
+        status = 0
+        for item in sessions.pool.lines(key, setup, f"serascmd -find_jobs '{serasQuery}' -report 'name dir status'"):
+            if isinstance(item, int):   # exit status , always the last item
+                status = item
+                span.set(status=item, rows=rows)
+                continue
+            row = parseStatusLine(item, wanted)
+            if row is not None:
+                rows += 1
+                yield row
+    if status != 0:   # raised after the loop so the session is released as healthy , the shell itself is fine
+        raise SerascmdError(f"serascmd exited with status {status}")
+
+
+def serverRows(tb_srv_dir):
+    # Every RUNNING/FAILED row on the server as [Target, basedir name, status] , None if serascmd failed
+    # Kept whole for the shared cache , other people monitor other runs on the same server
+    try:
+        return [list(row) for row in statusRows(tb_srv_dir)]
+    except (sessions.SessionError, TimeoutError, OSError) as e:
+        print(f"serascmd failed for {tb_srv_dir}: {e}")
+        return None
+
+
+def serverStatus(tb_srv_dir, wanted, shared=None):
+    # {basedir name: [(Target, status)]} for the names in wanted , None if serascmd failed
+    with trace.span("getStatus", server=tb_srv_dir, shared=shared is not None):
+        status = defaultdict(list)
+        if shared is None:
+            # rows for runs we don't monitor are dropped while parsing
+            try:
+                for Target, base_dir, state in statusRows(tb_srv_dir, wanted):
+                    status[base_dir].append((Target, state))
+            except (sessions.SessionError, TimeoutError, OSError) as e:
+                print(f"serascmd failed for {tb_srv_dir}: {e}")
+                return None
+            return status
+        rows = shared.getOrCompute("status", tb_srv_dir, lambda: serverRows(tb_srv_dir))
+        if rows is None:
+            return None
+        for Target, base_dir, state in rows:
+            if base_dir not in wanted:
+                if Verbose:
+                    print(f"{base_dir} from {tb_srv_dir} is not a run we monitor")  # jobs of runs we aren't monitoring on the same server
+                continue
+            status[base_dir].append((Target, state))
+        return status
+
+
+def attachStatus(status, run_map):
+    # serverStatus rows onto the runs they belong to , a dict walk
+    # status None (the query failed) flags the runs instead , so the snapshot diff and history don't read it as no jobs
+    if status is None:
+        for runs in run_map.values():
+            for run in runs:
+                run.dictionary[statusUnknown] = True
+        return
+    for base_dir, runs in run_map.items():
+        for Target, state in status.get(base_dir, ()):
+            for run in runs:
+                run.dictionary[statusTargets[state]].append(Target)
+
+
+def attachQuery(tb_srv_dir, query, run_map):
+    try:
+        status = query.result()
+    except Exception as e:
+        print(f"Status query failed for {tb_srv_dir}: {e}")
+        status = None
+    attachStatus(status, run_map)
+
+
+def queryServer(tb_srv_dir, run_map, shared=None):
+    attachStatus(serverStatus(tb_srv_dir, run_map, shared), run_map)
+
+
+def parseStatusLine(line, wanted=None):
+    # name dir status row from serascmd -> (Target, basedir name, status) , None for anything else
+    # wanted (anything with in , e.g. a run map) limits it to the basedir names we monitor
+    if "\x1b" in line:
+        line = ansiEscape.sub('', line)
+    line = line.rstrip()
+    if not line.endswith(statusSuffixes):   # PASSED / QUEUED / headers , rejected before splitting anything
+        return None
+    parts = line.split()
+    if len(parts) != 3:
+        return None
+    Target, job_dir, status = parts
+    if status not in statusTargets:
+        return None
+    name = job_dir.rpartition("/")[2]
+    if wanted is not None and name not in wanted:
+        return None
+    return Target, name, status
+
+
+class Run():
+    def __init__(self,json,monitor):
+        self.dictionary = json
+        self.paramsCache = monitor.paramsCache
+        self.validityFlag = True
+        self.ACTIVE = False
+        self.ERROR = False
+        with trace.span("Run", basedir=json.get("basedir"), tilename=json.get("tilename"), label=json.get("label")) as span:
+            self.getParams()
+            span.set(workspace=self.dictionary.get("FLOW_DIR"), valid=self.validityFlag)
+        self.dictionary["RUNNING_TARGETS"] = []
+        self.dictionary["FAILED_TARGETS"] = []
+        self.dictionary["link"] = []
+
+    def getParams(self):
+        try:
+            params_path = os.path.join(self.dictionary["basedir"], "params.json")
+            
+            params = self.paramsCache.get(params_path)   # the on-disk cache when size and mtime still match , params.json otherwise
+            for parameter in paramsNeeded:
+                self.dictionary[parameter] = params[parameter]
+
+    
+        except FileNotFoundError:
+            print(f"File not found: {params_path}")
+            self.validityFlag = False   
+        except PermissionError as e:
+            print(f"PermissionError: {e} while accessing {params_path}")
+            self.validityFlag = False
+
+
+
+def main():
+
+   TileBuilderMonitor = Monitor()
+   TileBuilderMonitor.WriteToJson()    
+   TileBuilderMonitor.closeStream()
+   TileBuilderMonitor.writeProfile()
+   if TileBuilderMonitor.streamFailed:
+       sys.exit(1)
+
+if __name__ == "__main__":
+    main()
+
+# changs to make , get flowdir from p4 rather than json 
+# get techno from pdk dir path 
+# run faster please 
+
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+
+# Backend benchmark against a synthetic site , no /tool/aticad tree or live TileBuilder server needed
+# For every size a fixture is generated :
+#   current_users.json   , the monitored runs plus --site-factor times as many lines for other users
+#   runs/<user>/<run>/   , params.json and data/*QorData dirs
+#   servers/<n>/         , a TB_SRV_DIR , .cshrc and the rows its serascmd reports (ours and other people's)
+#   bin/                 , stub tcsh / serascmd / fc_shell / module with configurable latency , first on PATH
+#   work/                , the checkout the backend runs in (tmp_TileBuilderMonitor/ ends up here)
+# Each pass runs Monitor end to end in a fresh interpreter and reports wall time , peak RSS and how many
+# subprocesses it started. The first pass is cold , later ones find warm caches and up to date QoR
+#
+#   python TileBuilderMonitor_bench_fixture.py
+#   python TileBuilderMonitor_bench_fixture.py --runs 100,1000 --engine async --seras-latency 0.5 --json bench.json
+
+benchUser = "tbmbench"
+defaultSizes = [10, 100, 1000, 10000]
+stubLog = "calls.log"   # one line per stub invocation , that is the subprocess count
+
+# The stubs are bash , tcsh included : its setenv is all the generated .cshrc files need
+stubs = {
+    "tcsh": """#!/bin/bash
+echo tcsh >> "$TBM_BENCH_ROOT/calls.log"
+setenv() { export "$1=$2"; }
+export -f setenv
+if [ "$1" = "-c" ]; then exec bash -c "$2"; fi
+exec bash -s
+""",
+    "serascmd": """#!/bin/bash
+echo serascmd >> "$TBM_BENCH_ROOT/calls.log"
+sleep "$TBM_BENCH_SERAS_LATENCY"
+cat "$TBM_BENCH_SRV/rows.txt"
+""",
+    "fc_shell": """#!/bin/bash
+echo fc_shell >> "$TBM_BENCH_ROOT/calls.log"
+out=$(printf '%s' "$2" | sed -n 's/.*-output \\([^;]*\\);.*/\\1/p')
+sleep "$TBM_BENCH_FC_LATENCY"
+mkdir -p "$out" && echo "<html>$2</html>" > "$out/index.html"
+""",
+    "module": """#!/bin/bash
+echo module >> "$TBM_BENCH_ROOT/calls.log"
+""",
+}
+
+qorStages = ["PlaceQorData", "PrePlaceQorData", "SynthesizeQorData"]
+targets = ["FxSynth", "FxPrePlace", "FxPlace", "FxCts", "FxRoute"]
+workerSnippet = "--worker"
+
+
+def makeFixture(root, runs, runs_per_workspace=20, runs_per_tile=4, servers=4, site_factor=4, seed=1):
+    # Writes the fixture for runs monitored runs under root , returns the current_users.json path
+    rng = random.Random(seed)
+    root = Path(root)
+    for sub in ("bin", "runs", "servers", "work"):
+        (root / sub).mkdir(parents=True, exist_ok=True)
+    for name, body in stubs.items():
+        path = root / "bin" / name
+        path.write_text(body)
+        path.chmod(0o755)
+
+    server_dirs = []
+    for n in range(max(1, servers)):
+        server_dir = root / "servers" / f"srv{n}"
+        server_dir.mkdir(exist_ok=True)
+        (server_dir / ".cshrc").write_text(f"setenv TBM_BENCH_SRV {server_dir}\n")
+        server_dirs.append(server_dir)
+    rows = {server_dir: [] for server_dir in server_dirs}
+
+    lines = []
+    for i in range(runs):
+        workspace = i // max(1, runs_per_workspace)
+        basedir = root / "runs" / benchUser / f"run{i}"
+        server_dir = server_dirs[workspace % len(server_dirs)]
+        tilename = f"ws{workspace}_tile{(i % max(1, runs_per_workspace)) // max(1, runs_per_tile)}"
+        for stage in rng.sample(qorStages, rng.randint(0, len(qorStages))):
+            (basedir / "data" / stage).mkdir(parents=True, exist_ok=True)
+        basedir.mkdir(parents=True, exist_ok=True)
+        (basedir / "params.json").write_text(json.dumps({"params": {
+            "TECHNO_NAME": "bench", "FLOW_DIR": f"/flow/ws{workspace}", "TB_SRV_DIR": str(server_dir),
+            "FC_MODULE": "fc/bench", "PROJECT": "bench", "TILEBUILDER_VERSION": "1.0",   # keys we don't read still cost a parse
+        }}))
+        lines.append({"username": benchUser, "basedir": str(basedir), "tilename": tilename,
+                      "label": f"lab{workspace % 3}", "nickname": f"r{i}"})
+        for target in targets:
+            status = rng.choice(["RUNNING", "FAILED", "PASSED", "PASSED"])
+            colour = "\x1b[1m" if status == "RUNNING" else ""   # serascmd colours some rows
+            rows[server_dir].append(f"{colour}{target}\x1b[0m ../../run{i} {status}" if colour else f"{target} ../../run{i} {status}")
+
+    for j in range(runs * max(0, site_factor)):
+        server_dir = server_dirs[j % len(server_dirs)]
+        lines.append({"username": f"user{j % 97}", "basedir": f"/proj/other/user{j % 97}/run{j}",
+                      "tilename": f"tile{j % 50}", "label": "other", "nickname": f"o{j}"})
+        rows[server_dir].append(f"{rng.choice(targets)} ../../other{j} {rng.choice(['RUNNING', 'FAILED'])}")
+    rng.shuffle(lines)   # ours are spread through the site file like they are for real
+
+    for server_dir, server_rows in rows.items():
+        (server_dir / "rows.txt").write_text("\n".join(server_rows) + "\n")
+    current_users = root / "current_users.json"
+    current_users.write_text("".join(json.dumps(line) + "\n" for line in lines))
+    return current_users
+
+
+def benchEnv(root, seras_latency, fc_latency):
+    env = dict(os.environ)
+    env.update({
+        "PATH": f"{Path(root) / 'bin'}{os.pathsep}{env.get('PATH', '')}",
+        "USER": benchUser,
+        "LOGNAME": benchUser,
+        "TBM_BENCH_ROOT": str(root),
+        "TBM_BENCH_SERAS_LATENCY": str(seras_latency),
+        "TBM_BENCH_FC_LATENCY": str(fc_latency),
+    })
+    return env
+
+
+def stubCalls(root):
+    try:
+        with open(Path(root) / stubLog, 'r') as file:
+            return Counter(line.strip() for line in file if line.strip())
+    except FileNotFoundError:
+        return Counter()
+
+
+def runPass(root, inputs, env, verbose=False):
+    # One end to end backend run in a fresh interpreter , returns its measurements
+    root = Path(root)
+    result_path = root / "result.json"
+    with open(root / "inputs.json", 'w') as file:
+        json.dump(inputs, file)
+    before = stubCalls(root)
+    log = None if verbose else open(root / "backend.log", 'a')
+    try:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), workerSnippet, str(root)],
+            cwd=root / "work", env=env, stdout=log, stderr=subprocess.STDOUT if log else None,
+        )
+    finally:
+        if log:
+            log.close()
+    if proc.returncode != 0:
+        raise RuntimeError(f"backend failed with exit code {proc.returncode} , see {root / 'backend.log'}")
+    with open(result_path, 'r') as file:
+        result = json.load(file)
+    calls = stubCalls(root) - before
+    result["subprocesses"] = sum(calls.values())
+    result["calls"] = dict(calls)
+    return result
+
+
+def runWorker(root):
+    # Inside the fresh interpreter , cwd is the fixture's work dir
+    import resource
+    from TileBuilderMonitor_backend import Monitor
+
+    root = Path(root)
+    with open(root / "inputs.json", 'r') as file:
+        inputs = json.load(file)
+    start = time.perf_counter()
+    monitor = Monitor(inputs=inputs)
+    monitor.WriteToJson()
+    wall = time.perf_counter() - start
+    monitor.writeProfile()
+    runs = [run for workspace in monitor.validWorkSpaces for run in workspace.validRuns]
+    result = {
+        "wall_s": wall,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,   # KB on Linux
+        "runs": len(runs),
+        "workspaces": len(monitor.validWorkSpaces),
+        "targets": sum(len(run.dictionary["RUNNING_TARGETS"]) + len(run.dictionary["FAILED_TARGETS"]) for run in runs),
+    }
+    with open(root / "result.json", 'w') as file:
+        json.dump(result, file)
+    return 0
+
+
+def main(argv):
+    if argv[:1] == [workerSnippet]:
+        return runWorker(argv[1])
+
+    parser = argparse.ArgumentParser(prog="TileBuilderMonitor_bench_fixture", description="Benchmark the TileBuilder Monitor backend on synthetic fixtures")
+    parser.add_argument("--runs", default=",".join(map(str, defaultSizes)), help="comma separated fixture sizes (monitored runs)")
+    parser.add_argument("--passes", type=int, default=2, help="backend runs per size , the first one is cold")
+    parser.add_argument("--engine", choices=["threads", "async"], default="threads")
+    parser.add_argument("--no-qor", dest="qor", action="store_false", help="skip compare_qor_data")
+    parser.add_argument("--seras-latency", type=float, default=0.05, help="seconds every serascmd call takes")
+    parser.add_argument("--fc-latency", type=float, default=0.02, help="seconds every fc_shell call takes")
+    parser.add_argument("--servers", type=int, default=4, help="TB_SRV_DIRs the workspaces are spread over")
+    parser.add_argument("--runs-per-workspace", type=int, default=20)
+    parser.add_argument("--runs-per-tile", type=int, default=4)
+    parser.add_argument("--site-factor", type=int, default=4, help="lines for other users in current_users.json per monitored run")
+    parser.add_argument("--profile", action="store_true", help="pass --profile to the backend , trace.json per size in the fixture")
+    parser.add_argument("--dir", default=None, help="where to build the fixtures (default a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep the fixtures afterwards")
+    parser.add_argument("--json", default=None, help="also write the results here , to compare against a later run")
+    parser.add_argument("--verbose", action="store_true", help="show the backend output instead of logging it to the fixture")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.runs.split(",") if size.strip()]
+    base = Path(args.dir or tempfile.mkdtemp(prefix="tbm-bench-")).resolve()
+    results = []
+    print(f"{'runs':>7} {'pass':>4} {'wall s':>8} {'runs/s':>8} {'peak MB':>8} {'procs':>6}  calls")
+    try:
+        for size in sizes:
+            root = base / f"runs{size}"
+            if root.exists():
+                shutil.rmtree(root)
+            start = time.perf_counter()
+            current_users = makeFixture(root, size, args.runs_per_workspace, args.runs_per_tile, args.servers, args.site_factor)
+            if args.verbose:
+                print(f"fixture for {size} runs in {time.perf_counter() - start:.1f}s at {root}")
+            env = benchEnv(root, args.seras_latency, args.fc_latency)
+            inputs = {"user": benchUser, "run_dir": None, "qor": args.qor, "engine": args.engine,
+                      "current_users": str(current_users), "profile": args.profile}
+            for n in range(max(1, args.passes)):
+                result = runPass(root, inputs, env, args.verbose)
+                result.update({"size": size, "pass": n, "engine": args.engine})
+                results.append(result)
+                rate = result["runs"] / result["wall_s"] if result["wall_s"] else 0.0
+                calls = " ".join(f"{name}={count}" for name, count in sorted(result["calls"].items()))
+                print(f"{size:7d} {'cold' if n == 0 else 'warm':>4} {result['wall_s']:8.2f} {rate:8.0f} "
+                      f"{result['peak_rss_mb']:8.1f} {result['subprocesses']:6d}  {calls}")
+                if result["runs"] != size:
+                    print(f"{'':13} only {result['runs']} of {size} runs came back")
+    finally:
+        if args.keep or args.dir:
+            print(f"Fixtures kept in {base}")
+        else:
+            shutil.rmtree(base, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
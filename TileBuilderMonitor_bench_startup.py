@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+
+# Startup budget check for the three entry points
+# Import time comes from python -X importtime (median of a few fresh interpreters) ,
+# time to first paint is the wall time from launching the frontend until its window has been drawn once
+# Exits 1 if anything is over budget or an entry point imports something it shouldn't , so it can gate a change
+#
+#   python TileBuilderMonitor_bench_startup.py
+#   python TileBuilderMonitor_bench_startup.py --budget backend=40 --paint-budget 800 --repeat 9
+#   python TileBuilderMonitor_bench_startup.py --baseline fedd7fa   # budgets from that commit , measured on this machine now
+
+entryPoints = {
+    "orchestrator": "TileBuilderMonitor",
+    "backend": "TileBuilderMonitor_backend",
+    "frontend": "TileBuilderMonitor_frontend",
+}
+
+# ms of cumulative import time , the median of a few --repeat 9 runs on a loaded build host plus 50% ,
+# import time swings by a third from run to run there so a tighter number just flaps (orchestrator 40-59 ms)
+defaultBudgets = {
+    "orchestrator": 90,
+    "backend": 80,
+    "frontend": 80,
+}
+defaultHeadroom = 0.25   # --baseline , how much slower than the baseline commit an entry point may import
+minHeadroomMs = 10       # and never less than this , a 20 ms import is all noise
+defaultPaintBudget = 1500   # ms
+
+# What each entry point must never pull in , the backend has no business loading Tk and the GUI none loading the engines
+forbidden = {
+    "orchestrator": ["tkinter", "TileBuilderMonitor_backend", "TileBuilderMonitor_frontend"],
+    "backend": ["tkinter", "TileBuilderMonitor_frontend", "unittest"],
+    "frontend": ["TileBuilderMonitor_backend", "TileBuilderMonitor_async", "TileBuilderMonitor_index",
+                 "TileBuilderMonitor_sessions", "TileBuilderMonitor_scheduler", "concurrent.futures.process"],
+}
+
+paintSnippet = """
+import TileBuilderMonitor_frontend as frontend
+app = frontend.TileBuilderMonitorApp()
+app.root.update()
+print("painted", flush=True)
+app.root.destroy()
+"""
+
+
+def importTimes(module, root):
+    # One fresh interpreter , returns {module: (self us, cumulative us)} in import order
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue   # the header line
+        times[fields[2].strip()] = (self_us, cumulative_us)
+    return times
+
+
+def measureImports(name, module, root, repeat, top):
+    runs = [importTimes(module, root) for _ in range(repeat)]
+    total_ms = statistics.median(run[module][1] for run in runs) / 1000.0
+    imported = set(runs[0])
+    bad = [mod for mod in forbidden.get(name, []) if mod in imported]
+    slowest = sorted(runs[0].items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return total_ms, bad, slowest
+
+
+def measurePaint(root, timeout):
+    # ms from launch to first paint , None without a display
+    if not os.environ.get("DISPLAY"):
+        return None
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", paintSnippet], cwd=root, stdout=subprocess.PIPE, text=True)
+    try:
+        assert proc.stdout is not None
+        for line in proc.stdout:
+            if line.strip() == "painted":
+                return (time.perf_counter() - start) * 1000.0
+        return None
+    finally:
+        try:
+            proc.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def exportTree(ref, root, dest):
+    # the files of a commit , without touching the checkout
+    archive = subprocess.run(["git", "archive", ref], cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if archive.returncode != 0:
+        raise SystemExit(f"--baseline {ref}: {archive.stderr.decode(errors='replace').strip()}")
+    subprocess.run(["tar", "-x", "-C", dest], input=archive.stdout, check=True)
+
+
+def baselineBudgets(ref, root, repeat, headroom, budgets):
+    # budget = what the entry point takes at ref on this machine right now , plus headroom
+    budgets = dict(budgets)
+    with tempfile.TemporaryDirectory(prefix="tbm-baseline-") as tree:
+        exportTree(ref, root, tree)
+        for name, module in entryPoints.items():
+            try:
+                runs = [importTimes(module, tree) for _ in range(repeat)]
+            except RuntimeError:
+                print(f"{name:13} not importable at {ref} , keeping the {budgets[name]:.0f} ms budget")
+                continue
+            baseline_ms = statistics.median(run[module][1] for run in runs) / 1000.0
+            budgets[name] = max(baseline_ms * (1 + headroom), baseline_ms + minHeadroomMs)
+            print(f"{name:13} import {baseline_ms:7.1f} ms  at {ref}")
+    return budgets
+
+
+def parseBudgets(values):
+    budgets = {}
+    for value in values or []:
+        name, _, ms = value.partition("=")
+        if name not in entryPoints or not ms:
+            raise SystemExit(f"--budget expects one of {', '.join(entryPoints)}=MS , got {value!r}")
+        budgets[name] = float(ms)
+    return budgets
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="TileBuilderMonitor_bench_startup", description="Check TileBuilder Monitor startup against a time budget")
+    parser.add_argument("--budget", action="append", metavar="ENTRY=MS", help="import time budget for an entry point , repeatable")
+    parser.add_argument("--paint-budget", type=float, default=defaultPaintBudget, metavar="MS", help="frontend time to first paint budget")
+    parser.add_argument("--repeat", type=int, default=5, help="fresh interpreters per entry point , the median is used")
+    parser.add_argument("--top", type=int, default=5, help="slowest imports to list per entry point")
+    parser.add_argument("--no-paint", action="store_true", help="skip the time to first paint check")
+    parser.add_argument("--baseline", metavar="REF", help="set the import budgets from this commit measured now , plus --headroom")
+    parser.add_argument("--headroom", type=float, default=defaultHeadroom, help="fraction over the --baseline figure that is still ok")
+    args = parser.parse_args(argv)
+
+    root = Path(__file__).resolve().parent
+    budgets = dict(defaultBudgets)
+    if args.baseline:
+        budgets = baselineBudgets(args.baseline, root, max(1, args.repeat), args.headroom, budgets)
+    budgets.update(parseBudgets(args.budget))
+    failed = False
+
+    for name, module in entryPoints.items():
+        total_ms, bad, slowest = measureImports(name, module, root, max(1, args.repeat), args.top)
+        over = total_ms > budgets[name]
+        failed = failed or over or bool(bad)
+        print(f"{name:13} import {total_ms:7.1f} ms  budget {budgets[name]:.0f} ms  {'OVER' if over else 'ok'}")
+        for mod in bad:
+            print(f"{'':13} imports {mod} , it shouldn't")
+        for mod, (self_us, _) in slowest:
+            print(f"{'':15} {self_us / 1000.0:6.1f} ms  {mod}")
+
+    if not args.no_paint:
+        paint_ms = measurePaint(root, timeout=30)
+        if paint_ms is None:
+            print("frontend      first paint skipped , no display")
+        else:
+            over = paint_ms > args.paint_budget
+            failed = failed or over
+            print(f"frontend      first paint {paint_ms:7.1f} ms  budget {args.paint_budget:.0f} ms  {'OVER' if over else 'ok'}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
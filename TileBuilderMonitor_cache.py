@@ -0,0 +1,320 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import TileBuilderMonitor_trace as trace
+
+
+# Caches for things we read over NFS on every launch
+
+paramsCacheSize = 5000   # entries kept on disk , least recently used get dropped first
+qorStageIndexSize = 5000
+sharedTTL = 120          # seconds a shared cache entry is good for , --shared-ttl
+sharedLockTimeout = 600  # seconds we wait on someone else's refresh before doing it ourselves
+
+
+def writeAtomic(path, write, mode=None):
+    # write(file) goes to a temp file next to path which is then renamed over it , a reader never sees half a file
+    # The temp name is per process and thread , other users and our own threads may be writing the same path
+    # Raises whatever the write raised , with the temp file cleaned up
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'w') as file:
+            write(file)
+        if mode is not None:
+            os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def writeJsonAtomic(path, data, mode=None, what=None):
+    # compact JSON through writeAtomic , False (after saying so) if it couldn't be written
+    # dumps goes through the C encoder , json.dump to a file does not
+    try:
+        writeAtomic(path, lambda file: file.write(json.dumps(data, separators=(",", ":"))), mode)
+        return True
+    except OSError as e:
+        print(f"Could not save {what or path}: {e}")
+        return False
+
+
+class ParamsCache():
+    # params.json cache shared by Monitor.getWorkSpaces and Run.getParams
+    # Entries are keyed on (path, mtime, size) so an unchanged params.json only costs a stat , and only once per process
+    # Only the params we actually use are kept , params.json itself is big
+
+    def __init__(self, cache_path, keys, max_entries=paramsCacheSize, shared=None):
+        self.cache_path = cache_path
+        self.keys = list(keys)
+        self.max_entries = max_entries
+        self.shared = shared           # SharedCache , checked before reading a params.json ourselves
+        self.entries = OrderedDict()   # path -> {"mtime": , "size": , "params": {}}
+        self.verified = set()          # paths already stat'ed this process , no need to go back to NFS
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.total_hits = 0            # across all invocations , saved with the cache
+        self.total_misses = 0
+        self.dirty = False
+
+    def load(self):
+        try:
+            with open(self.cache_path, 'r') as file:
+                saved = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError, PermissionError):
+            return
+        if saved.get("keys") != self.keys:
+            return   # paramsNeeded changed , old entries don't have what we need
+        self.entries = OrderedDict((entry["path"], entry) for entry in saved.get("entries", []))
+        self.total_hits = saved.get("hits", 0)
+        self.total_misses = saved.get("misses", 0)
+
+    def save(self):
+        with self.lock:
+            if not self.dirty and not self.hits:
+                return
+            saved = {
+                "keys": self.keys,
+                "hits": self.total_hits + self.hits,
+                "misses": self.total_misses + self.misses,
+                "entries": list(self.entries.values()),
+            }
+        if writeJsonAtomic(self.cache_path, saved):
+            self.dirty = False
+
+    def get(self, params_path):
+        # Returns {param: value} for the cached keys , raises FileNotFoundError/PermissionError like open() would
+        with trace.span("params.json", path=params_path, server=trace.nfsServer(params_path)) as span:
+            params, source = self.lookup(params_path)
+            span.set(source=source)
+            return params
+
+    def lookup(self, params_path):
+        # (params , where they came from : "memory" / "cache" / "shared" / "file")
+        with self.lock:
+            if params_path in self.verified:
+                self.hits += 1
+                self.entries.move_to_end(params_path)
+                return self.entries[params_path]["params"], "memory"
+
+        st = os.stat(params_path)
+        with self.lock:
+            entry = self.entries.get(params_path)
+            if entry and entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+                self.hits += 1
+                self.entries.move_to_end(params_path)
+                self.verified.add(params_path)
+                return entry["params"], "cache"
+
+        read_here = []   # read() only runs here on a shared cache miss
+
+        def read():
+            read_here.append(True)
+            with open(params_path, 'r') as params_file:
+                params = json.load(params_file)["params"]
+            return {
+                "path": params_path,
+                "mtime": st.st_mtime,
+                "size": st.st_size,
+                "keys": self.keys,
+                "params": {key: params[key] for key in self.keys if key in params},
+            }
+
+        if self.shared is None:
+            entry = read()
+        else:
+            entry = self.shared.getOrCompute(
+                "params", params_path, read,
+                validate=lambda e: e.get("mtime") == st.st_mtime and e.get("size") == st.st_size and e.get("keys") == self.keys,
+            )
+        with self.lock:
+            self.misses += 1
+            self.entries[params_path] = entry
+            self.entries.move_to_end(params_path)
+            self.verified.add(params_path)
+            while len(self.entries) > self.max_entries:
+                old_path, _ = self.entries.popitem(last=False)
+                self.verified.discard(old_path)
+            self.dirty = True
+        return entry["params"], "file" if read_here or self.shared is None else "shared"
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = (100.0 * self.hits / total) if total else 0.0
+        return (f"params cache: {self.hits} hits , {self.misses} misses ({rate:.0f}% hit rate) , "
+                f"{self.total_hits + self.hits} hits / {self.total_misses + self.misses} misses overall")
+
+
+class QoRStageIndex():
+    # Which *QorData stages each run has and their mtimes , from one scandir of basedir/data
+    # An entry stays good as long as data/ itself has the same mtime (a stage dir appearing or going away bumps it)
+    # so a refresh costs one stat per run instead of an isdir per stage
+
+    def __init__(self, cache_path, max_entries=qorStageIndexSize):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()   # data dir -> {"mtime": , "stages": {stage: mtime}}
+        self.lock = threading.Lock()
+        self.dirty = False
+
+    def load(self):
+        try:
+            with open(self.cache_path, 'r') as file:
+                self.entries = OrderedDict(json.load(file))
+        except (FileNotFoundError, json.JSONDecodeError, PermissionError, TypeError, ValueError):
+            self.entries = OrderedDict()
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            saved = list(self.entries.items())
+        if writeJsonAtomic(self.cache_path, saved):
+            self.dirty = False
+
+    def stages(self, basedir):
+        # {stage dir name: mtime} for every *QorData dir under basedir/data , {} if there is no data dir
+        data_dir = os.path.join(os.path.abspath(basedir), "data")
+        try:
+            mtime = os.stat(data_dir).st_mtime
+        except OSError:
+            return {}
+        with self.lock:
+            entry = self.entries.get(data_dir)
+            if entry and entry["mtime"] == mtime:
+                self.entries.move_to_end(data_dir)
+                return entry["stages"]
+
+        stages = {}
+        try:
+            with os.scandir(data_dir) as it:
+                for entry in it:
+                    if entry.name.endswith("QorData") and entry.is_dir():
+                        stages[entry.name] = entry.stat().st_mtime
+        except OSError:
+            return {}
+        with self.lock:
+            self.entries[data_dir] = {"mtime": mtime, "stages": stages}
+            self.entries.move_to_end(data_dir)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+        return stages
+
+    def merge(self, other):
+        # entries another process found (a coordinator worker) , theirs are the newer ones
+        with self.lock:
+            for data_dir, entry in other.entries.items():
+                self.entries[data_dir] = entry
+                self.entries.move_to_end(data_dir)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = self.dirty or bool(other.entries)
+
+
+class SharedCache():
+    # Cache directory shared by everyone on a project , --shared-cache
+    # One json file per entry (namespace/sha1(key).json) with the time it was written , good for ttl seconds
+    # Refreshes are single flight : whoever finds an entry stale takes an fcntl lock on its .lock file and refreshes it ,
+    # everyone else blocks on the same lock and then reuses what was written instead of doing the work again
+    # flock is per open file so this holds across threads as well as across processes and hosts sharing the dir
+
+    def __init__(self, cache_dir, ttl=sharedTTL, lock_timeout=sharedLockTimeout):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0   # lookups that waited on someone else's refresh and got a hit out of it
+        self.lock = threading.Lock()
+
+    def path(self, namespace, key):
+        return os.path.join(self.cache_dir, namespace, hashlib.sha1(key.encode()).hexdigest() + ".json")
+
+    def fresh(self, namespace, key, validate=None):
+        # value if there is an entry younger than ttl (and validate(value) agrees) , else None
+        try:
+            with open(self.path(namespace, key), 'r') as file:
+                entry = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if entry.get("key") != key or time.time() - entry.get("ts", 0) > self.ttl:
+            return None
+        value = entry.get("value")
+        if validate is not None and not validate(value):
+            return None
+        return value
+
+    def store(self, namespace, key, value):
+        path = self.path(namespace, key)
+        # 0o664 , the rest of the team refreshes it too
+        writeJsonAtomic(path, {"key": key, "ts": time.time(), "value": value}, mode=0o664, what=f"shared cache {path}")
+
+    def acquire(self, namespace, key):
+        # Open lock file held exclusively , None if it couldn't be had within lock_timeout
+        path = self.path(namespace, key) + ".lock"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        except OSError as e:
+            print(f"Could not lock shared cache {path}: {e}")
+            return None
+        deadline = time.time() + self.lock_timeout
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                if time.time() > deadline:
+                    os.close(fd)
+                    return None
+                time.sleep(0.1)
+            except OSError as e:   # e.g. an NFS mount without lock support
+                print(f"Could not lock shared cache {path}: {e}")
+                os.close(fd)
+                return None
+
+    def release(self, fd):
+        if fd is None:
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def getOrCompute(self, namespace, key, compute, validate=None):
+        # Cached value or compute() , which is stored unless it returns None (failures aren't shared)
+        value = self.fresh(namespace, key, validate)
+        if value is not None:
+            self.count("hits")
+            return value
+        fd = self.acquire(namespace, key)
+        try:
+            value = self.fresh(namespace, key, validate)   # refreshed by whoever held the lock before us
+            if value is not None:
+                self.count("waits")
+                return value
+            self.count("misses")
+            value = compute()
+            if value is not None and fd is not None:
+                self.store(namespace, key, value)
+            return value
+        finally:
+            self.release(fd)
+
+    def summary(self):
+        return f"shared cache: {self.hits} hits , {self.waits} reused after waiting , {self.misses} refreshed"
@@ -0,0 +1,28 @@
+import os
+
+
+# Small helpers shared by the orchestrator , backend and frontend
+# Keep this module cheap to import : standard library only , nothing that pulls in Tk or the backend engines
+
+outRoot = "tmp_TileBuilderMonitor"   # relative to the checkout , the backend runs with cwd there
+snapshotName = "tmp.json"
+inputsName = "inputs.json"
+
+
+def getUser():
+    # $USER like printenv would give us , without spawning a process for it
+    user = os.environ.get("USER") or os.environ.get("LOGNAME")
+    if not user:
+        try:
+            import pwd
+            user = pwd.getpwuid(os.getuid()).pw_name
+        except (ImportError, KeyError):
+            print("Could not work out the current user , set $USER")
+            exit(1)
+    return user
+
+
+def outDir(user=None, root=None):
+    # tmp_TileBuilderMonitor/<user> , under root if given
+    path = os.path.join(outRoot, user or getUser())
+    return os.path.join(root, path) if root else path
@@ -0,0 +1,259 @@
+import argparse
+import heapq
+import json
+import math
+import os
+import shlex
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from TileBuilderMonitor_common import getUser, inputsName, outDir, snapshotName
+
+
+# Coordinator mode , one backend split over N worker processes
+# The coordinator looks up the runs once , groups them by TB_SRV_DIR and FLOW_DIR and deals the groups out to shards
+# by run count (largest group to the lightest shard) , so a workspace never straddles two workers and every
+# server is queried by one worker only
+# Each worker runs the normal Monitor / WorkSpace / Run pipeline on its shard and writes a partial snapshot ,
+# the coordinator merges those into tmp.json and does the events / history once
+# Workers only read params_cache.json , the coordinator (which reads every params.json to shard) saves it once ,
+# their QoR stage index goes to the shard dir and the coordinator folds those into the user's one
+#
+# Shards live in tmp_TileBuilderMonitor/<user>/shards/<n>/ (inputs.json in , tmp.json out) , so any worker that
+# can see the checkout can run one. How a worker is started is up to the transport :
+#   local    , a subprocess on this host (default)
+#   command  , a shell template , e.g. for farm hosts
+#              --transport-cmd 'ssh {host} cd {root} && {python} {script} --worker {shard}'
+#              {python} {script} {root} {shard} {index} {host} are filled in (quoted) per shard
+
+shardsName = "shards"
+qorStageIndexName = "qor_stage_index.json"
+sharedLanes = ("seras", "fc")   # lanes that hit shared servers , their limits are split across the workers
+
+
+def balanceShards(groups, workers):
+    # groups {key: [records]} -> list of workers lists of records , longest processing time first
+    shards = [[] for _ in range(max(1, workers))]
+    heap = [(0, i) for i in range(len(shards))]
+    for key in sorted(groups, key=lambda k: len(groups[k]), reverse=True):
+        load, i = heapq.heappop(heap)
+        shards[i].extend(groups[key])
+        heapq.heappush(heap, (load + len(groups[key]), i))
+    return [shard for shard in shards if shard]
+
+
+def groupByServer(records, paramsCache, jobs=16):
+    # group -> [records] , runs that share a TB_SRV_DIR or a FLOW_DIR end up in the same group (connected through
+    # either , so a FLOW_DIR spread over two servers takes both along) , params.json through the cache ,
+    # runs we can't read go together and get dropped by the worker
+    def params(record):
+        try:
+            found = paramsCache.get(os.path.join(record["basedir"], "params.json"))
+            return ("flow", found.get("FLOW_DIR")), ("server", found.get("TB_SRV_DIR"))
+        except (OSError, KeyError, ValueError):
+            return None
+
+    parent = {}
+
+    def find(key):
+        while parent.setdefault(key, key) != key:
+            parent[key] = parent[parent[key]]
+            key = parent[key]
+        return key
+
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="tbm-shard") as executor:
+        keys = list(executor.map(params, records))
+    for key in keys:
+        if key is not None:
+            flow, server = key
+            parent[find(flow)] = find(server) if server[1] is not None else find(flow)
+    groups = defaultdict(list)
+    for record, key in zip(records, keys):
+        groups[find(key[0]) if key is not None else None].append(record)
+    return groups
+
+
+class LocalTransport():
+    # Worker as a subprocess on this host
+    def __init__(self, root):
+        self.root = root
+        self.script = os.path.abspath(__file__)
+
+    def command(self, index, shard_dir):
+        return [sys.executable, self.script, "--worker", shard_dir]
+
+    def start(self, index, shard_dir):
+        return subprocess.Popen(self.command(index, shard_dir), cwd=self.root)
+
+
+class CommandTransport(LocalTransport):
+    # Worker started through a shell command template , hosts are used round robin
+    def __init__(self, root, template, hosts=()):
+        super().__init__(root)
+        self.template = template
+        self.hosts = list(hosts) or ["localhost"]
+
+    def command(self, index, shard_dir):
+        fields = {
+            "python": sys.executable,
+            "script": self.script,
+            "root": self.root,
+            "shard": shard_dir,
+            "index": str(index),
+            "host": self.hosts[index % len(self.hosts)],
+        }
+        return self.template.format(**{key: shlex.quote(value) for key, value in fields.items()})
+
+    def start(self, index, shard_dir):
+        return subprocess.Popen(self.command(index, shard_dir), cwd=self.root, shell=True)
+
+
+def workerLimits(inputs, workers):
+    # Per worker lane limits , shared lanes are split so N workers don't hit a server N times as hard
+    from TileBuilderMonitor_scheduler import defaultLimits
+    limits = {}
+    for lane, default in defaultLimits.items():
+        limit = inputs.get(f"{lane}_jobs") or default
+        limits[f"{lane}_jobs"] = max(1, math.ceil(limit / workers)) if lane in sharedLanes else limit
+    return limits
+
+
+def coordinate(root, inputs, transport=None):
+    # Runs the shards and merges them , returns (shards that failed , shards)
+    from TileBuilderMonitor_backend import lookupRecords, paramsNeeded, toMonitor, writeResults
+    from TileBuilderMonitor_cache import ParamsCache, QoRStageIndex, SharedCache, sharedTTL
+    from TileBuilderMonitor_snapshot import readSnapshot
+    import TileBuilderMonitor_trace as trace
+
+    if inputs.get("profile"):
+        trace.enable()
+    user = getUser()
+    out_dir = outDir(user)
+    workers = max(1, int(inputs.get("workers") or 1))
+    start_time = time.time()
+    transport = transport or LocalTransport(root)
+
+    # The GUI's stream ends with our done (or with our connection dropping if we die) , never a worker's ,
+    # so we connect first and hold on. Workers on this host stream their runs themselves as they go , but each
+    # has its own connection and so its own reader on the GUI side , their last runs can land after our done.
+    # So for every transport we send the merged runs again on our connection , right before done
+    gui = None
+    if inputs.get("stream"):
+        from TileBuilderMonitor_stream import StreamClient
+        try:
+            gui = StreamClient(inputs["stream"])
+        except OSError as e:
+            print(f"Could not connect to the frontend at {inputs['stream']}: {e}")
+    stream = inputs.get("stream") if gui is not None and type(transport) is LocalTransport else None
+
+    records = lookupRecords(toMonitor(inputs, user), inputs.get("current_users"))
+    shared = SharedCache(inputs["shared_cache"], inputs.get("shared_ttl") or sharedTTL) if inputs.get("shared_cache") else None
+    paramsCache = ParamsCache(f"{out_dir}/params_cache.json", paramsNeeded, shared=shared)
+    paramsCache.load()
+    with trace.span("groupByServer", runs=len(records)):
+        groups = groupByServer(records, paramsCache, inputs.get("nfs_jobs") or 16)
+    paramsCache.save()   # workers start from a warm cache and never write it
+    shards = balanceShards(groups, workers)
+    print(f"{len(records)} runs in {len(groups)} server groups over {len(shards)} workers : "
+          f"{' , '.join(str(len(shard)) for shard in shards)} runs each")
+
+    limits = workerLimits(inputs, len(shards))
+    procs = []
+    for index, shard in enumerate(shards):
+        shard_dir = os.path.join(root, out_dir, shardsName, str(index))
+        os.makedirs(shard_dir, exist_ok=True)
+        for name in (snapshotName, qorStageIndexName):
+            try:
+                os.unlink(os.path.join(shard_dir, name))   # never merge a stale partial
+            except FileNotFoundError:
+                pass
+        shard_inputs = dict(inputs, records=shard, stream=stream, stream_done=False, save_caches=False, **limits)
+        with open(os.path.join(shard_dir, inputsName), 'w') as file:
+            json.dump(shard_inputs, file)
+        procs.append((index, shard_dir, transport.start(index, shard_dir)))
+
+    merged = []
+    failed = 0
+    worker_events = []
+    qorStages = QoRStageIndex(f"{out_dir}/{qorStageIndexName}") if inputs.get("qor", False) else None
+    if qorStages is not None:
+        qorStages.load()
+    with trace.span("workers", shards=len(shards)):
+        for index, shard_dir, proc in procs:
+            rc = proc.wait()
+            path = os.path.join(shard_dir, snapshotName)
+            if trace.enabled:
+                # each worker timed itself , its spans keep their pid so the trace shows one process per worker
+                worker_events.extend(trace.readEvents(os.path.join(shard_dir, trace.traceName)))
+            if rc != 0 or not os.path.exists(path):
+                print(f"Worker {index} failed (exit code {rc}) , its runs are missing from this snapshot")
+                failed += 1
+                continue
+            merged.extend(readSnapshot(path))
+            if qorStages is not None:
+                shard_stages = QoRStageIndex(os.path.join(shard_dir, qorStageIndexName))
+                shard_stages.load()
+                qorStages.merge(shard_stages)
+
+    if qorStages is not None:
+        qorStages.save()
+    with trace.span("WriteToJson"):
+        merged = writeResults(out_dir, merged)   # with the targets carried for runs whose query failed
+    if gui is not None:
+        try:
+            for record in merged:
+                gui.send({"type": "run", "record": record})
+            gui.send({"type": "done", "runs": len(merged), "failed": failed})
+        except OSError as e:
+            print(f"Could not tell the frontend we are done: {e}")
+        gui.close()
+    print(f"Coordinator merged {len(merged)} runs from {len(shards) - failed}/{len(shards)} workers "
+          f"in {time.time() - start_time:.2f} seconds")
+    if trace.enabled:
+        print(trace.write(out_dir, worker_events))
+        print(f"Trace written to {os.path.join(out_dir, trace.traceName)}")
+    return failed, len(shards)
+
+
+def runWorker(shard_dir):
+    # One shard through the normal pipeline , partial snapshot to shard_dir/tmp.json
+    from TileBuilderMonitor_backend import Monitor
+    from TileBuilderMonitor_snapshot import writeSnapshot
+
+    with open(os.path.join(shard_dir, inputsName), 'r') as file:
+        inputs = json.load(file)
+    monitor = Monitor(inputs=inputs)
+    writeSnapshot(os.path.join(shard_dir, snapshotName), monitor.snapshotRecords())
+    if inputs.get("qor", False):   # params_cache.json is the coordinator's , this the coordinator merges
+        monitor.qorStages.cache_path = os.path.join(shard_dir, qorStageIndexName)
+        monitor.qorStages.save()
+    monitor.closeStream()
+    monitor.writeProfile(shard_dir)
+    return 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="TileBuilderMonitor_coordinator", description="Run the TileBuilder Monitor backend as N sharded workers")
+    parser.add_argument("--worker", metavar="SHARD_DIR", help="run one shard (started by the coordinator)", default=None)
+    parser.add_argument("--transport-cmd", dest="transport_cmd", help="shell template to start a worker , see the top of this file", default=None)
+    parser.add_argument("--hosts", help="comma separated hosts for {host} in --transport-cmd", default="")
+    args = parser.parse_args(argv)
+
+    root = os.getcwd()   # backend paths are relative to the checkout , the orchestrator / transport start us there
+    if args.worker:
+        return runWorker(args.worker)
+
+    with open(os.path.join(outDir(), inputsName), 'r') as file:
+        inputs = json.load(file)
+    template = args.transport_cmd or inputs.get("transport_cmd")
+    hosts = [host for host in (args.hosts or inputs.get("hosts") or "").split(",") if host]
+    transport = CommandTransport(root, template, hosts) if template else LocalTransport(root)
+    failed, shards = coordinate(root, inputs, transport)
+    return 1 if shards and failed == shards else 0   # a partial snapshot is still worth showing
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,5 +1,8 @@
+import argparse
 import json
+import queue
 import re
+from collections import OrderedDict
 from pathlib import Path
 import os
 import signal
@@ -8,11 +11,84 @@ import shlex
 import tkinter as tk
 import tkinter.font as tkfont
 from tkinter import ttk
-from TileBuilderMonitor_backend import Monitor
+from TileBuilderMonitor_common import outDir, snapshotName
+from TileBuilderMonitor_search import RunSearchIndex
+from TileBuilderMonitor_snapshot import iterSnapshot, statusUnknown
+
+
+NO_FLOW_DIR = "(no FLOW_DIR)"
+
+# Token splitters for wrapping: tree cells break on path separators and whitespace, the detail table on JSON punctuation too
+TREE_SPLITTER = re.compile(r"([/\s,_-])")
+TABLE_SPLITTER = re.compile(r"([/\s,._\-\{\}\[\]:])")
+
+SEARCH_HINT = "tile:NAME  failed:TARGET  running:TARGET  label:  nick:  user:  dir:  /run/dir/  tile:gfx_*"
+
+
+class TextMeasureCache:
+    """
+    Memoized font measurement and wrapping.
+    Token widths are cached per font and summed, so wrapping a cell costs one measure per new token
+    instead of one per growing prefix; whole wrapped results are kept in an LRU keyed by (text, width).
+    """
+
+    def __init__(self, max_wrapped: int = 20000):
+        self.max_wrapped = max_wrapped
+        self.widths: dict[tuple, int] = {}  # (font key, token) -> px
+        self.wrapped: OrderedDict[tuple, tuple[str, ...]] = OrderedDict()
+        self.font_keys: dict[str, tuple] = {}
+
+    def font_key(self, font: tkfont.Font) -> tuple:
+        # Named fonts can be reconfigured, so key on what they actually resolve to
+        name = str(font)
+        key = self.font_keys.get(name)
+        if key is None:
+            key = self.font_keys[name] = tuple(sorted(font.actual().items()))
+        return key
+
+    def width(self, font: tkfont.Font, token: str, font_key: tuple | None = None) -> int:
+        key = (font_key or self.font_key(font), token)
+        px = self.widths.get(key)
+        if px is None:
+            px = self.widths[key] = font.measure(token)
+        return px
+
+    def wrap(self, text: str, max_px: int, font: tkfont.Font, splitter: re.Pattern) -> list[str]:
+        font_key = self.font_key(font)
+        key = (font_key, splitter.pattern, text, max_px)
+        lines = self.wrapped.get(key)
+        if lines is not None:
+            self.wrapped.move_to_end(key)
+            return list(lines)
+
+        out_lines: list[str] = []
+        for para in text.splitlines() or [""]:
+            cur, cur_px = "", 0
+            for tok in splitter.split(para):
+                if tok == "":
+                    continue
+                tok_px = self.width(font, tok, font_key)
+                if cur_px + tok_px <= max_px or cur == "":
+                    cur, cur_px = cur + tok, cur_px + tok_px
+                else:
+                    out_lines.append(cur)
+                    cur = tok.lstrip()
+                    cur_px = self.width(font, cur, font_key)
+            out_lines.append(cur)
+
+        self.wrapped[key] = tuple(out_lines)
+        if len(self.wrapped) > self.max_wrapped:
+            self.wrapped.popitem(last=False)
+        return out_lines
+
+    def clear(self):
+        self.widths.clear()
+        self.wrapped.clear()
+        self.font_keys.clear()
 
 
 class TileBuilderMonitorApp:
-    def __init__(self, master=None):
+    def __init__(self, master=None, stream=None, messages=None, on_close=None):
         self.root = master or tk.Tk()
         # Window sizing
         sw = self.root.winfo_screenwidth()
@@ -35,18 +111,40 @@ class TileBuilderMonitorApp:
         self.wrap_enabled = False
         self.records: list[dict] = []
         self.item_to_records: dict[str, dict | list] = {}
+        self.item_to_flow_dir: dict[str, str] = {}
+        self.flow_parent_ids: dict[str, str] = {}
+        self.flow_states: dict[str, str] = {}  # FLOW_DIR -> "loading" / "done" while the backend is streaming
+        self.records_by_basedir: dict[str, dict] = {}
         self.right_item_to_record: dict[str, dict] = {}
-
-        # Track real Button widgets for Open Xterm column
-        self._open_buttons: dict[str, tk.Button] = {}
+        self.text_cache = TextMeasureCache()
+        self.search_index = RunSearchIndex()
+        self.search_query = ""
+        self.search_shown = 0  # runs the last _populate_grouped kept after the search filter
+        self._search_pending = False
+        self._search_dirty = False  # streamed runs arrived while filtering, re-filter at the end of the drain tick
+        self.log_excerpts = None  # LogExcerptCache, created the first time a run detail window opens
+        self.stream_server = None
+        self.stream_messages = None  # queue of backend messages, fed by the socket server or by an in-process backend
+        self.on_close = on_close
+
+        # Open Xterm column: a small pool of real Buttons rebound to whichever rows are visible
+        self._open_buttons: list[tk.Button] = []
+        self._open_button_rows: dict[tk.Button, str] = {}  # button -> row it currently sits on
+        self._open_button_places: dict[tk.Button, tuple] = {}  # last place() geometry, skip unchanged ones
+        self._right_rows: tuple = ()
+        self._open_buttons_pending = False
 
         # UI build & signals
         self._setup_signals()
         self._build_ui()
 
-        # Load initial data
-        self.records = self._load_json_records()
-        self._populate_grouped(self.records)
+        # Load initial data, either streamed from the backend as it works or from tmp.json once it is done
+        if stream or messages is not None:
+            self._start_stream(stream, messages)
+        else:
+            self.records = self._load_json_records()
+            self.search_index = RunSearchIndex(self.records)
+            self._populate_grouped(self.records)
 
     def _build_ui(self):
         # Menubar with "Display" dropdown
@@ -68,6 +166,18 @@ class TileBuilderMonitorApp:
         menubar.add_cascade(label="Display", menu=display_menu)
         self.root.config(menu=menubar)
 
+        # Search bar: filters the tree as you type, see TileBuilderMonitor_search for the query syntax
+        search_frame = ttk.Frame(self.root)
+        search_frame.pack(side=tk.TOP, fill=tk.X, padx=6, pady=(6, 0))
+        ttk.Label(search_frame, text="Search:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar(value="")
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
+        search_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=(4, 8))
+        search_entry.bind("<Escape>", lambda e: self.search_var.set(""))
+        self.search_status = ttk.Label(search_frame, text=SEARCH_HINT)
+        self.search_status.pack(side=tk.LEFT)
+        self.search_var.trace_add("write", lambda *a: self._schedule_search())
+
         # Main paned layout
         main = ttk.Panedwindow(self.root, orient=tk.HORIZONTAL)
         main.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=6, pady=6)
@@ -134,7 +244,7 @@ class TileBuilderMonitorApp:
         hsb_r = ttk.Scrollbar(right_frame, orient="horizontal", command=self.tree_right.xview)
         def _on_right_scroll(*a):
             vsb_r.set(*a)
-            self._position_open_buttons()
+            self._schedule_open_buttons()
         self.tree_right.configure(yscrollcommand=_on_right_scroll, xscrollcommand=hsb_r.set)
         self.tree_right.grid(row=0, column=0, sticky="nsew")
         vsb_r.grid(row=0, column=1, sticky="ns")
@@ -143,12 +253,8 @@ class TileBuilderMonitorApp:
         right_frame.columnconfigure(0, weight=1)
         self.tree_right.bind("<Double-1>", self._on_right_activate)
         self.tree_right.bind("<Return>", self._on_right_activate)
-        self.tree_right.bind("<Configure>", lambda e: self._position_open_buttons())
-        self.tree_right.bind("<Expose>", lambda e: self._position_open_buttons())
-        self.tree_right.bind("<ButtonRelease-1>", lambda e: self._position_open_buttons())
-        self.tree_right.bind("<MouseWheel>", lambda e: self.root.after_idle(self._position_open_buttons))
-        self.tree_right.bind("<Button-4>", lambda e: self.root.after_idle(self._position_open_buttons))
-        self.tree_right.bind("<Button-5>", lambda e: self.root.after_idle(self._position_open_buttons))
+        for seq in ("<Configure>", "<Expose>", "<ButtonRelease-1>", "<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.tree_right.bind(seq, lambda e: self._schedule_open_buttons(), add="+")
 
     def _on_display_change(self, event=None):
         self.wrap_enabled = (self.display_var.get() == "Wrap to new line")
@@ -157,67 +263,18 @@ class TileBuilderMonitorApp:
     def _load_json_records(self):
         # Load tmp.json next to this script
         script_dir = Path(__file__).resolve().parent
-        path = script_dir / f"tmp_TileBuilderMonitor/{Monitor.getUser()}/tmp.json"
+        path = Path(outDir(root=script_dir)) / snapshotName
         try:
-            text = path.read_text()
+            return list(iterSnapshot(path))
         except Exception as e:
             print(f"[ERROR] Failed to read {path} (cwd={Path.cwd()}): {e}")
             return []
 
-        # Strip // comments
-        lines = [ln for ln in text.splitlines() if not ln.strip().startswith("//")]
-        cleaned = "\n".join(lines).strip()
-        if not cleaned:
-            return []
-
-        # Try standard JSON first
-        try:
-            loaded = json.loads(cleaned)
-            if isinstance(loaded, dict):
-                return [loaded]
-            if isinstance(loaded, list):
-                return loaded
-        except json.JSONDecodeError:
-            pass
-
-        # Fallback: parse concatenated objects
-        records = []
-        dec = json.JSONDecoder()
-        idx = 0
-        n = len(cleaned)
-        while idx < n:
-            while idx < n and cleaned[idx].isspace():
-                idx += 1
-            if idx >= n:
-                break
-            try:
-                obj, end = dec.raw_decode(cleaned, idx)
-                if isinstance(obj, dict):
-                    records.append(obj)
-                idx = end
-            except json.JSONDecodeError:
-                idx += 1
-        return records
-
     def _wrap_text(self, text: str, max_px: int) -> str:
         if not self.wrap_enabled:
             return str(text)
-        lines = []
-        for para in str(text).splitlines() or [""]:
-            tokens = re.split(r"([/\s,_-])", para)
-            cur = ""
-            for tok in tokens:
-                if tok == "":
-                    continue
-                trial = cur + tok
-                # measure with Treeview font
-                if self.row_font.measure(trial) <= max_px or cur == "":
-                    cur = trial
-                else:
-                    lines.append(cur)
-                    cur = tok.lstrip()
-            lines.append(cur)
-        return "\n".join(lines)
+        # measure with Treeview font
+        return "\n".join(self.text_cache.wrap(str(text), max_px, self.row_font, TREE_SPLITTER))
 
     def _split_for_left(self, text: str, max_px: int) -> list[str]:
         """
@@ -243,14 +300,55 @@ class TileBuilderMonitorApp:
         suffix_parts = c_parts[i - 1:]
         return "/" + "/".join(suffix_parts)
 
+    def _flow_label(self, flow_dir: str) -> str:
+        label = f"FLOW DIRECTORY: {flow_dir}"
+        if self.flow_states.get(flow_dir) == "loading":
+            label += "  (loading...)"
+        return label
+
+    def _insert_flow_parent(self, flow_dir: str, recs: list[dict], left_w: int) -> str:
+        parent_lines = self._split_for_left(self._flow_label(flow_dir), left_w)
+        parent_id = self.tree_left.insert("", "end", text=parent_lines[0], tags=("flow",))
+        self.item_to_records[parent_id] = recs
+        self.item_to_flow_dir[parent_id] = flow_dir
+        self.flow_parent_ids[flow_dir] = parent_id
+        for cont in parent_lines[1:]:
+            cont_id = self.tree_left.insert(parent_id, "end", text=cont, tags=("flow",))
+            self.item_to_records[cont_id] = recs
+            self.item_to_flow_dir[cont_id] = flow_dir
+        return parent_id
+
+    def _insert_run_child(self, parent_id: str, flow_dir: str, idx: int, r: dict, left_w: int):
+        basedir = r.get("basedir", "(no basedir)")
+        child_label = self._suffix_from_last_common_dir(flow_dir, basedir) if flow_dir != NO_FLOW_DIR else basedir
+        child_text = f"RUN DIRECTORY {idx}: {child_label}"
+        child_lines = self._split_for_left(child_text, left_w)
+        child_id = self.tree_left.insert(parent_id, "end", text=child_lines[0])
+        self.item_to_records[child_id] = r
+        self.item_to_flow_dir[child_id] = flow_dir
+        for cont in child_lines[1:]:
+            sib_id = self.tree_left.insert(parent_id, "end", text=cont)
+            self.item_to_records[sib_id] = r
+            self.item_to_flow_dir[sib_id] = flow_dir
+
     def _populate_grouped(self, records):
+        # Keep the selected FLOW_DIR selected across a rebuild
+        sel = self.tree_left.selection()
+        selected_flow = self.item_to_flow_dir.get(sel[0]) if sel else None
+
         # Clear trees and mapping
         for row in self.tree_left.get_children():
             self.tree_left.delete(row)
         for row in self.tree_right.get_children():
             self.tree_right.delete(row)
         self.item_to_records.clear()
+        self.item_to_flow_dir.clear()
+        self.flow_parent_ids.clear()
         self.right_item_to_record.clear()
+        self.records_by_basedir = {r.get("basedir"): r for r in records}
+        if self.search_query:
+            records = self.search_index.filter(self.search_query)  # every record when the query has no terms (e.g. "tile:")
+        self.search_shown = len(records)
 
         # Column widths (pixels)
         left_w = int(self.tree_left.column("#0", option="width"))
@@ -262,36 +360,22 @@ class TileBuilderMonitorApp:
         # Group by FLOW_DIR (always ensure a parent exists)
         groups: dict[str, list[dict]] = {}
         for rec in records:
-            fd = rec.get("FLOW_DIR") or "(no FLOW_DIR)"
+            fd = rec.get("FLOW_DIR") or NO_FLOW_DIR
             groups.setdefault(fd, []).append(rec)
+        for fd, state in self.flow_states.items():
+            if state == "loading" and not self.search_query:
+                groups.setdefault(fd, [])  # streamed workspace with no runs back yet
 
         # Insert parents and children on left, expand all
         for flow_dir in sorted(groups.keys()):
             recs = groups[flow_dir]
-
-            parent_label = f"FLOW DIRECTORY: {flow_dir}"
-            parent_lines = self._split_for_left(parent_label, left_w)
-            parent_id = self.tree_left.insert("", "end", text=parent_lines[0], tags=("flow",))
-            self.item_to_records[parent_id] = recs
-            for cont in parent_lines[1:]:
-                cont_id = self.tree_left.insert(parent_id, "end", text=cont, tags=("flow",))
-                self.item_to_records[cont_id] = recs
-
+            parent_id = self._insert_flow_parent(flow_dir, recs, left_w)
             for idx, r in enumerate(recs, start=1):
-                basedir = r.get("basedir", "(no basedir)")
-                child_label = self._suffix_from_last_common_dir(flow_dir, basedir) if flow_dir != "(no FLOW_DIR)" else basedir
-                child_text = f"RUN DIRECTORY {idx}: {child_label}"
-                child_lines = self._split_for_left(child_text, left_w)
-                child_id = self.tree_left.insert(parent_id, "end", text=child_lines[0])
-                self.item_to_records[child_id] = r
-                for cont in child_lines[1:]:
-                    sib_id = self.tree_left.insert(parent_id, "end", text=cont)
-                    self.item_to_records[sib_id] = r
-
+                self._insert_run_child(parent_id, flow_dir, idx, r, left_w)
             self.tree_left.item(parent_id, open=True)
 
-        # Initial right pane: show runs for first parent (if any)
-        first = next(iter(self.tree_left.get_children()), None)
+        # Initial right pane: show runs for the previously selected parent, else the first one (if any)
+        first = self.flow_parent_ids.get(selected_flow) or next(iter(self.tree_left.get_children()), None)
         if first:
             self.tree_left.selection_set(first)
             self._refresh_right_for_item(first, right_dir_w, right_run_w, right_fail_w, right_open_w)
@@ -301,6 +385,115 @@ class TileBuilderMonitorApp:
         if not self.wrap_enabled:
             self.style.configure(self.right_style_name, rowheight=24)
 
+    # --- Progressive loading from the backend stream ---
+    def _start_stream(self, path: str | None = None, messages: queue.Queue | None = None):
+        if messages is None:
+            from TileBuilderMonitor_stream import StreamServer
+            self.stream_server = StreamServer(path)
+            messages = self.stream_server.messages
+        self.stream_messages = messages
+        self.root.title("TileBuilder Monitor (loading...)")
+        self.root.after(50, self._drain_stream)
+
+    def _drain_stream(self):
+        changed = False
+        finished = None
+        for _ in range(500):  # bounded so a flood of runs can't starve the UI
+            try:
+                msg = self.stream_messages.get_nowait()
+            except queue.Empty:
+                break
+            kind = msg.get("type")
+            if kind in ("done", "closed"):
+                finished = "closed" if msg.get("failed") else kind  # a coordinator with shards missing
+                break
+            changed = self._apply_stream_message(msg) or changed
+        if self._search_dirty and not finished:
+            self._search_dirty = False
+            self._populate_grouped(self.records)
+            self._update_search_status()
+        if finished:
+            # Final pass: sorted flow dirs, numbering and wrapping all consistent
+            for fd in self.flow_states:
+                self.flow_states[fd] = "done"
+            self._populate_grouped(self.records)
+            self._update_search_status()
+            if finished == "closed":
+                self.root.title("TileBuilder Monitor (backend stopped early, results may be incomplete)")
+            else:
+                self.root.title("TileBuilder Monitor")
+            return
+        if changed:
+            self._on_left_select()
+        self.root.after(100, self._drain_stream)
+
+    def _apply_stream_message(self, msg: dict) -> bool:
+        """Apply one workspace/run message to the trees; True if the right pane may need a refresh."""
+        left_w = int(self.tree_left.column("#0", option="width"))
+        kind = msg.get("type")
+        if kind == "workspace":
+            fd = msg.get("FLOW_DIR") or NO_FLOW_DIR
+            self.flow_states[fd] = msg.get("state", "loading")
+            if self.search_query:
+                return False  # only matching runs are shown while filtering
+            parent_id = self.flow_parent_ids.get(fd)
+            if parent_id is None:
+                parent_id = self._insert_flow_parent(fd, [], left_w)
+                self.tree_left.item(parent_id, open=True)
+            else:
+                self.tree_left.item(parent_id, text=self._split_for_left(self._flow_label(fd), left_w)[0])
+            if not self.tree_left.selection():
+                self.tree_left.selection_set(parent_id)
+            return False
+        if kind == "run":
+            rec = msg.get("record") or {}
+            basedir = rec.get("basedir")
+            existing = self.records_by_basedir.get(basedir)
+            if existing is not None:
+                # Updated record (e.g. QoR link filled in); update in place so every view sees it
+                existing.clear()
+                existing.update(rec)
+                self.search_index.update(existing)
+                return True
+            self.records.append(rec)
+            self.records_by_basedir[basedir] = rec
+            self.search_index.add(rec)
+            if self.search_query:
+                self._search_dirty = True
+                return False
+            fd = rec.get("FLOW_DIR") or NO_FLOW_DIR
+            parent_id = self.flow_parent_ids.get(fd)
+            if parent_id is None:
+                parent_id = self._insert_flow_parent(fd, [], left_w)
+                self.tree_left.item(parent_id, open=True)
+            recs = self.item_to_records[parent_id]
+            recs.append(rec)
+            self._insert_run_child(parent_id, fd, len(recs), rec, left_w)
+            return True
+        return False
+
+    def _schedule_search(self):
+        # One re-filter per idle pass however fast the user types
+        if self._search_pending:
+            return
+        self._search_pending = True
+        self.root.after_idle(self._apply_search)
+
+    def _apply_search(self):
+        self._search_pending = False
+        query = self.search_var.get().strip()
+        if query == self.search_query:
+            return
+        self.search_query = query
+        self._populate_grouped(self.records)
+        self._update_search_status()
+
+    def _update_search_status(self):
+        if self.search_query:
+            self.search_status.configure(text=f"{self.search_shown} of {len(self.records)} runs")
+        else:
+            self.search_status.configure(text=SEARCH_HINT)
+
     def _on_left_select(self, event=None):
         # Recompute right pane for current selection
         sel = self.tree_left.selection()
@@ -325,27 +518,19 @@ class TileBuilderMonitorApp:
         runs = payload if isinstance(payload, list) else [payload]
 
         max_lines_right = 1
-        cur = item_id
-        while True:
-            parent = self.tree_left.parent(cur)
-            if not parent:
-                parent_flow_text = self.tree_left.item(cur, "text")
-                break
-            cur = parent
-        if parent_flow_text.startswith("FLOW DIRECTORY: "):
-            flow_dir = parent_flow_text[len("FLOW DIRECTORY: "):].replace("\n", " ")
-        else:
-            flow_dir = "(no FLOW_DIR)"
+        flow_dir = self.item_to_flow_dir.get(item_id, NO_FLOW_DIR)
 
         for r in runs:
             basedir = r.get("basedir", "(no basedir)")
-            child_label = self._suffix_from_last_common_dir(flow_dir, basedir) if flow_dir != "(no FLOW_DIR)" else basedir
+            child_label = self._suffix_from_last_common_dir(flow_dir, basedir) if flow_dir != NO_FLOW_DIR else basedir
             run_dir_out = self._wrap_text(child_label, dir_w)
 
             running = r.get("RUNNING_TARGETS", [])
             failed = r.get("FAILED_TARGETS", [])
             running_str = ", ".join(map(str, running)) if isinstance(running, (list, tuple)) else str(running or "")
             failed_str = ", ".join(map(str, failed)) if isinstance(failed, (list, tuple)) else str(failed or "")
+            if r.get(statusUnknown):   # serascmd failed , these are the targets of the last good refresh
+                running_str = f"(status unknown) {running_str}".rstrip()
             running_out = self._wrap_text(running_str, run_w)
             failed_out = self._wrap_text(failed_str, fail_w)
 
@@ -412,25 +597,8 @@ class TileBuilderMonitorApp:
         s = "" if text is None else str(text)
         if not s:
             return [""]
-        # Split existing newlines first; wrap each paragraph independently
-        paragraphs = s.splitlines() or [""]
-        out_lines: list[str] = []
-        # Break tokens on separators to keep paths and JSON readable
-        splitter = re.compile(r"([/\s,._\-\{\}\[\]:])")
-        for para in paragraphs:
-            tokens = splitter.split(para)
-            cur = ""
-            for tok in tokens:
-                if tok == "":
-                    continue
-                trial = cur + tok
-                if font.measure(trial) <= max_px or cur == "":
-                    cur = trial
-                else:
-                    out_lines.append(cur)
-                    cur = tok.lstrip()
-            out_lines.append(cur)
-        return out_lines or [""]
+        # Each paragraph is wrapped independently; tokens break on separators to keep paths and JSON readable
+        return self.text_cache.wrap(s, max_px, font, TABLE_SPLITTER) or [""]
 
     def _open_run_detail(self, rec: dict):
         """Open a new window displaying the record as a two-column table: Attribute | Value, with wrapping."""
@@ -441,18 +609,18 @@ class TileBuilderMonitorApp:
         x, y = (sw - w) // 2, (sh - h) // 2
         win.geometry(f"{w}x{h}+{x}+{y}")
 
-        frame = tk.Frame(win, padding=8)
+        frame = ttk.Frame(win, padding=8)
         frame.pack(fill=tk.BOTH, expand=True)
 
-        tree = tk.Treeview(frame, columns=("ATTRIBUTE", "VALUE"), show="headings", height=20)
+        tree = ttk.Treeview(frame, columns=("ATTRIBUTE", "VALUE"), show="headings", height=20)
         tree.heading("ATTRIBUTE", text="Attribute")
         tree.heading("VALUE", text="Value")
         # Initial column widths; user can resize, but we wrap based on these at open time
         tree.column("ATTRIBUTE", width=250, anchor=tk.W)
         tree.column("VALUE", width=800, anchor=tk.W)
 
-        vsb = tk.Scrollbar(frame, orient="vertical", command=tree.yview)
-        hsb = tk.Scrollbar(frame, orient="horizontal", command=tree.xview)
+        vsb = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+        hsb = ttk.Scrollbar(frame, orient="horizontal", command=tree.xview)
         tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
 
         tree.grid(row=0, column=0, sticky="nsew")
@@ -478,6 +646,68 @@ class TileBuilderMonitorApp:
                 v_cell = v_lines[i] if i < len(v_lines) else ""
                 tree.insert("", "end", values=(k_cell, v_cell))
 
+        if rec.get("FAILED_TARGETS"):
+            self._add_failed_excerpts(frame, rec, row_font)
+
+    def _get_log_excerpts(self):
+        if self.log_excerpts is None:
+            from TileBuilderMonitor_logscan import LogExcerptCache
+            script_dir = Path(__file__).resolve().parent
+            self.log_excerpts = LogExcerptCache(str(Path(outDir(root=script_dir)) / "log_excerpts.json"))
+            self.log_excerpts.load()
+        return self.log_excerpts
+
+    def _add_failed_excerpts(self, frame, rec: dict, row_font):
+        """First error lines of each failed target's log, scanned on a background thread and filled in as they finish."""
+        ttk.Label(frame, text="Failed target errors").grid(row=2, column=0, sticky="w", pady=(8, 2))
+        errors = ttk.Treeview(frame, columns=("TARGET", "LINE"), show="headings", height=10)
+        errors.heading("TARGET", text="Target")
+        errors.heading("LINE", text="First error lines")
+        errors.column("TARGET", width=250, anchor=tk.W)
+        errors.column("LINE", width=800, anchor=tk.W)
+        evsb = ttk.Scrollbar(frame, orient="vertical", command=errors.yview)
+        errors.configure(yscrollcommand=evsb.set)
+        errors.grid(row=3, column=0, sticky="nsew")
+        evsb.grid(row=3, column=1, sticky="ns")
+        frame.rowconfigure(3, weight=1)
+
+        pending = self._get_log_excerpts().failedTargets(rec)
+        placeholders = {target: errors.insert("", "end", values=(target, "scanning log...")) for target in pending}
+        line_w = int(errors.column("LINE", option="width"))
+
+        def show(target, path, lines):
+            anchor = placeholders.pop(target)
+            if path is None:
+                lines = ["(no log found)"]
+            elif not lines:
+                lines = [f"(no error lines in {path})"]
+            index = errors.index(anchor)
+            errors.delete(anchor)
+            first = True
+            for line in lines:
+                for part in self._wrap_lines_for_table(line, line_w, row_font):
+                    errors.insert("", index, values=(target if first else "", part))
+                    index += 1
+                    first = False
+
+        def poll():
+            # Futures finish on the scan threads; only this Tk callback touches the widgets
+            if not errors.winfo_exists():
+                return
+            for target, future in list(pending.items()):
+                if not future.done():
+                    continue
+                del pending[target]
+                try:
+                    path, lines = future.result()
+                except Exception as e:
+                    path, lines = "", [f"(could not read log: {e})"]
+                show(target, path, lines)
+            if pending:
+                errors.after(100, poll)
+
+        poll()
+
     def _setup_signals(self):
         for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGTSTP, getattr(signal, "SIGQUIT", None)):
             if sig is None:
@@ -491,10 +721,17 @@ class TileBuilderMonitorApp:
         self._shutdown()
 
     def _shutdown(self):
+        if self.stream_server is not None:
+            self.stream_server.close()
+        if self.log_excerpts is not None:
+            self.log_excerpts.save()
+            self.log_excerpts.shutdown()
         try:
             self.root.destroy()
         except Exception:
             pass
+        if self.on_close is not None:
+            self.on_close()
         os._exit(0)
 
     def run(self):
@@ -518,44 +755,71 @@ class TileBuilderMonitorApp:
 
     # --- Real button management for Open Xterm column ---
     def _create_open_buttons(self):
-        for b in self._open_buttons.values():
-            try:
-                b.destroy()
-            except Exception:
-                pass
-        self._open_buttons.clear()
-        for row_id in self.tree_right.get_children():
-            rec = self.right_item_to_record.get(row_id)
-            if not isinstance(rec, dict):
-                continue
-            basedir = rec.get('basedir')
-            btn = tk.Button(self.tree_right, text="Open", relief=tk.RAISED,
-                            command=lambda d=basedir: self._open_run_term(d))
-            btn.configure(cursor="hand2")
-            self._open_buttons[row_id] = btn
-        self._position_open_buttons()
+        # Rows changed: forget old bindings, the pool itself is kept and rebound on the next reposition
+        self._right_rows = self.tree_right.get_children()
+        self._open_button_rows.clear()
+        self._open_button_places.clear()
+        for btn in self._open_buttons:
+            btn.place_forget()
+        self._schedule_open_buttons()
+
+    def _schedule_open_buttons(self):
+        # Scroll, configure, expose and release events can fire many times a frame; reposition once when idle
+        if self._open_buttons_pending:
+            return
+        self._open_buttons_pending = True
+        self.root.after_idle(self._position_open_buttons)
+
+    def _open_button_clicked(self, btn: tk.Button):
+        rec = self.right_item_to_record.get(self._open_button_rows.get(btn))
+        if isinstance(rec, dict):
+            self._open_run_term(rec.get('basedir'))
+
+    def _visible_right_rows(self):
+        # The right tree is flat, so the yview fractions map straight onto row indexes
+        rows = self._right_rows
+        if not rows:
+            return ()
+        first, last = self.tree_right.yview()
+        start = max(0, int(first * len(rows)) - 1)
+        end = min(len(rows), int(last * len(rows)) + 2)
+        return rows[start:end]
 
     def _position_open_buttons(self):
-        try:
-            col_index = self.right_columns.index('OPEN_XTERM')
-        except ValueError:
+        self._open_buttons_pending = False
+        col_id = 'OPEN_XTERM'
+        if col_id not in self.right_columns:
             return
-        col_id = self.right_columns[col_index]
-        for row_id, btn in list(self._open_buttons.items()):
-            if not self.tree_right.exists(row_id):
-                try:
-                    btn.destroy()
-                except Exception:
-                    pass
-                self._open_buttons.pop(row_id, None)
+        placed = []
+        for row_id in self._visible_right_rows():
+            if not isinstance(self.right_item_to_record.get(row_id), dict):
                 continue
-            bbox = self.tree_right.bbox(row_id, col_id)
-            if not bbox:
-                btn.place_forget()
+            try:
+                bbox = self.tree_right.bbox(row_id, col_id)
+            except tk.TclError:
                 continue
-            x, y, width, height = bbox
-            btn.place(x=x+2, y=y+2, width=max(10, width-4), height=max(10, height-4))
-
+            if bbox:
+                placed.append((row_id, bbox))
+
+        # Grow the pool to the viewport; it never needs more buttons than rows fit on screen
+        while len(self._open_buttons) < len(placed):
+            btn = tk.Button(self.tree_right, text="Open", relief=tk.RAISED, cursor="hand2")
+            btn.configure(command=lambda b=btn: self._open_button_clicked(b))
+            self._open_buttons.append(btn)
+
+        for btn, (row_id, (x, y, width, height)) in zip(self._open_buttons, placed):
+            self._open_button_rows[btn] = row_id
+            geometry = (x + 2, y + 2, max(10, width - 4), max(10, height - 4))
+            if self._open_button_places.get(btn) != geometry:
+                btn.place(x=geometry[0], y=geometry[1], width=geometry[2], height=geometry[3])
+                self._open_button_places[btn] = geometry
+        for btn in self._open_buttons[len(placed):]:
+            if self._open_button_places.pop(btn, None) is not None:
+                btn.place_forget()
+            self._open_button_rows.pop(btn, None)
 
 if __name__ == "__main__":
-    TileBuilderMonitorApp().run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(prog="TileBuilderMonitor_frontend", description="TileBuilder Monitor GUI")
+    parser.add_argument("--stream", help="listen on this Unix socket for runs streamed by the backend", default=None)
+    args = parser.parse_args()
+    TileBuilderMonitorApp(stream=args.stream).run()
\ No newline at end of file
@@ -0,0 +1,187 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+from TileBuilderMonitor_common import outDir
+from TileBuilderMonitor_snapshot import statusUnknown
+
+
+# Run state history , every snapshot goes into a local sqlite db but only what changed gets a row
+#   run_state      , append only , one row per change of a target (RUNNING / FAILED / DONE) or of a run (PRESENT / GONE)
+#   current_state  , what is true right now and since when , the thing we diff each snapshot against
+#   snapshots      , one row per backend run
+# So "when did this target start failing" or "what has been RUNNING for 12 hours" is one indexed query
+
+historyName = "history.db"
+runTarget = ""   # target column for rows about the run itself
+
+schema = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    runs INTEGER NOT NULL,
+    changes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_state (
+    id INTEGER PRIMARY KEY,
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots(id),
+    ts REAL NOT NULL,
+    basedir TEXT NOT NULL,
+    tilename TEXT,
+    target TEXT NOT NULL,
+    status TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS current_state (
+    basedir TEXT NOT NULL,
+    target TEXT NOT NULL,
+    tilename TEXT,
+    status TEXT NOT NULL,
+    since REAL NOT NULL,
+    PRIMARY KEY (basedir, target)
+);
+CREATE INDEX IF NOT EXISTS run_state_basedir ON run_state (basedir, target, ts);
+CREATE INDEX IF NOT EXISTS run_state_tilename ON run_state (tilename, ts);
+CREATE INDEX IF NOT EXISTS run_state_target ON run_state (target, ts);
+CREATE INDEX IF NOT EXISTS run_state_status ON run_state (status, ts);
+CREATE INDEX IF NOT EXISTS run_state_ts ON run_state (ts);
+CREATE INDEX IF NOT EXISTS current_state_status ON current_state (status, since);
+CREATE INDEX IF NOT EXISTS current_state_tilename ON current_state (tilename);
+"""
+
+
+def connect(path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    # rollback journal , WAL needs shared memory that NFS home dirs don't give us ,
+    # DELETE also turns back a history.db an earlier version left in WAL mode (that setting sticks to the file)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.executescript(schema)
+    return conn
+
+
+def snapshotState(records):
+    # (basedir, target) -> (status, tilename) for one snapshot
+    state = {}
+    for record in records:
+        basedir = record.get("basedir")
+        if not basedir:
+            continue
+        tilename = record.get("tilename")
+        state[(basedir, runTarget)] = ("PRESENT", tilename)
+        for target in record.get("RUNNING_TARGETS") or []:
+            state[(basedir, target)] = ("RUNNING", tilename)
+        for target in record.get("FAILED_TARGETS") or []:
+            state[(basedir, target)] = ("FAILED", tilename)
+    return state
+
+
+def recordSnapshot(path, records, ts=None):
+    # Adds the snapshot to the history , returns how many rows changed
+    ts = time.time() if ts is None else ts
+    conn = connect(path)
+    try:
+        with conn:
+            current = {(b, t): (status, tilename) for b, t, status, tilename in
+                       conn.execute("SELECT basedir, target, status, tilename FROM current_state")}
+            new = snapshotState(records)
+            unknown = {record.get("basedir") for record in records if record.get(statusUnknown)}   # serascmd failed for these
+            changes = []
+            for key, (status, tilename) in new.items():
+                if key[0] in unknown and key[1] != runTarget:
+                    continue
+                if current.get(key, (None,))[0] != status:
+                    changes.append((key[0], tilename, key[1], status))
+            for key, (status, tilename) in current.items():
+                if key[0] in unknown and key[1] != runTarget:
+                    continue   # their targets stay as they were until a query gets through
+                if key not in new:
+                    changes.append((key[0], tilename, key[1], "GONE" if key[1] == runTarget else "DONE"))
+
+            snapshot_id = conn.execute(
+                "INSERT INTO snapshots (ts, runs, changes) VALUES (?, ?, ?)", (ts, len(records), len(changes))
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO run_state (snapshot_id, ts, basedir, tilename, target, status) VALUES (?, ?, ?, ?, ?, ?)",
+                [(snapshot_id, ts, basedir, tilename, target, status) for basedir, tilename, target, status in changes],
+            )
+            for basedir, tilename, target, status in changes:
+                if status in ("DONE", "GONE"):
+                    conn.execute("DELETE FROM current_state WHERE basedir = ? AND target = ?", (basedir, target))
+                else:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO current_state (basedir, target, tilename, status, since) VALUES (?, ?, ?, ?, ?)",
+                        (basedir, target, tilename, status, ts),
+                    )
+        return len(changes)
+    finally:
+        conn.close()
+
+
+def failingSince(conn, basedir, target):
+    # When the target last went to FAILED , None if it never did
+    row = conn.execute(
+        "SELECT ts FROM run_state WHERE basedir = ? AND target = ? AND status = 'FAILED' ORDER BY ts DESC LIMIT 1",
+        (basedir, target),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def stuck(conn, status, hours, now=None):
+    # (basedir, tilename, target, since) for targets that have been in status for at least hours
+    now = time.time() if now is None else now
+    return conn.execute(
+        "SELECT basedir, tilename, target, since FROM current_state WHERE status = ? AND since <= ? ORDER BY since",
+        (status, now - hours * 3600),
+    ).fetchall()
+
+
+def targetHistory(conn, basedir, target=None):
+    if target is None:
+        return conn.execute(
+            "SELECT ts, target, status FROM run_state WHERE basedir = ? ORDER BY ts", (basedir,)
+        ).fetchall()
+    return conn.execute(
+        "SELECT ts, target, status FROM run_state WHERE basedir = ? AND target = ? ORDER BY ts", (basedir, target)
+    ).fetchall()
+
+
+def fmt(ts):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="TileBuilderMonitor_history", description="Query the TileBuilder Monitor run history")
+    parser.add_argument("--db", help="history database", default=None)
+    parser.add_argument("--stuck-running", type=float, metavar="HOURS", help="targets RUNNING for at least HOURS")
+    parser.add_argument("--stuck-failed", type=float, metavar="HOURS", help="targets FAILED for at least HOURS")
+    parser.add_argument("--failing-since", nargs=2, metavar=("BASEDIR", "TARGET"), help="when TARGET last started failing")
+    parser.add_argument("--history", nargs="+", metavar=("BASEDIR", "TARGET"), help="every change for a run or one of its targets")
+    args = parser.parse_args(argv)
+
+    db = args.db or os.path.join(outDir(root=os.path.dirname(os.path.abspath(__file__))), historyName)
+    if not os.path.exists(db):
+        print(f"No history at {db}")
+        return 1
+    conn = sqlite3.connect(db)
+    try:
+        if args.stuck_running is not None:
+            for basedir, tilename, target, since in stuck(conn, "RUNNING", args.stuck_running):
+                print(f"{fmt(since)}  {tilename}  {target}  {basedir}")
+        if args.stuck_failed is not None:
+            for basedir, tilename, target, since in stuck(conn, "FAILED", args.stuck_failed):
+                print(f"{fmt(since)}  {tilename}  {target}  {basedir}")
+        if args.failing_since:
+            ts = failingSince(conn, *args.failing_since)
+            print(fmt(ts) if ts else "never failed")
+        if args.history:
+            for ts, target, status in targetHistory(conn, *args.history[:2]):
+                print(f"{fmt(ts)}  {status:8}  {target or '(run)'}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
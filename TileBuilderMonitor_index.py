@@ -0,0 +1,372 @@
+import fcntl
+import json
+import mmap
+import os
+import re
+import zlib
+
+from TileBuilderMonitor_cache import writeJsonAtomic
+from TileBuilderMonitor_selector import pathParts
+
+
+# Sidecar index for the site wide current_users.json
+# The file is append only in practice and has hundreds of thousands of lines , almost none of them are ours
+# So we remember the byte offset of every line per username and only parse the lines we need
+# The index is a directory : meta.json (state of current_users.json and every username) plus one segment file per
+# bucket of users (users.<n>.json , crc32 of the name) , so a warm -u alice reads the meta and one small segment ,
+# never the offsets of the whole site
+# Run dirs (-r) are found through the lines of users named in the path , else one memchr speed search of the file ,
+# only dir prefixes and path globs need a pass over every line
+# The index is keyed on (size, mtime, inode) of current_users.json , if the file only grew we just index the new tail
+
+indexVersion = 2
+userBuckets = 64      # segment files the users are spread over
+tailCheckBytes = 64   # bytes before indexed_to we re-read to make sure the file wasn't rewritten in place
+parallelScanBytes = 16 * 1024 * 1024   # below this a process pool costs more than it saves , scan in process
+chunksPerWorker = 4   # a few chunks per worker so one slow chunk doesn't hold up the whole scan
+
+Verbose = False
+
+# One line of current_users.json with a plain string username , group 1 , anything else (escaped quotes ,
+# non string values , no username) takes the last branch and gets a real json.loads
+# One regex pass over the mmap is what keeps a cold scan of the whole site file as cheap as the json.loads loop it replaced
+lineRegex = re.compile(rb'(?:[^\n]*?"username": *"([^"\\\n]*)"[^\n]*|[^\n]*)\n')
+basedirRegex = re.compile(rb'(?:[^\n]*?"basedir": *"([^"\\\n]*)"[^\n]*|[^\n]*)\n')
+
+
+def jsonNeedle(value):
+    # the bytes a string value shows up as between the quotes in current_users.json
+    return json.dumps(value)[1:-1].encode()
+
+
+def bucketOf(user):
+    return zlib.crc32(str(user).encode()) % userBuckets   # hash() is salted per process , this has to be stable
+
+
+def scanChunk(path, start, end, userNeedles):
+    # Worker for one newline aligned slice of current_users.json , in process or in a process pool on a cold index
+    # Returns the offsets of every line per username plus the decoded lines of the users we monitor
+    users = {}
+    candidates = []
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for match in lineRegex.finditer(mm, start, end):   # chunks always end right after a newline
+            user = match.group(1)
+            pos = match.start()
+            if user is not None:
+                if user in userNeedles:
+                    try:
+                        candidates.append((pos, json.loads(match.group())))
+                    except json.JSONDecodeError:
+                        pass
+                user = user.decode(errors="replace")   # no backslashes in there , the regex made sure
+                if user in users:
+                    users[user].append(pos)
+                else:
+                    users[user] = [pos]
+                continue
+            line = match.group()
+            if not line.strip():
+                continue
+            # odd line , rare enough to just parse it
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict) and isinstance(data.get("username"), str):
+                users.setdefault(data["username"], []).append(pos)
+                if jsonNeedle(data["username"]) in userNeedles:
+                    candidates.append((pos, data))
+    return users, candidates
+
+
+def usableCpus():
+    # what this process may run on , a batch slot or taskset can give us one CPU of a big machine
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def lineAt(mm, pos):
+    # (offset of the line holding pos , the parsed line) , None for a line that isn't a json object
+    start = mm.rfind(b"\n", 0, pos) + 1
+    end = mm.find(b"\n", pos)
+    try:
+        data = json.loads(mm[start:end if end != -1 else len(mm)])
+    except json.JSONDecodeError:
+        return start, None
+    return start, data if isinstance(data, dict) else None
+
+
+def chunkBounds(mm, start, end, chunks):
+    # split [start, end) into roughly equal pieces that each end right after a newline
+    bounds = []
+    step = max(1, (end - start) // chunks)
+    pos = start
+    while pos < end:
+        cut = mm.find(b"\n", min(pos + step, end - 1), end)
+        cut = end if cut == -1 else cut + 1
+        bounds.append((pos, cut))
+        pos = cut
+    return bounds
+
+
+class CurrentUsersIndex():
+    def __init__(self, source_path, index_dir):
+        self.source_path = source_path
+        self.index_dir = index_dir
+        self.names = set()    # every username in current_users.json , from meta.json
+        self.segments = {}    # bucket -> {username: [byte offsets of lines]} , read when a user in it is needed
+        self.dirtySegments = set()
+        self.size = -1
+        self.mtime = -1
+        self.inode = -1
+        self.indexed_to = 0  # offset right after the last complete line we indexed
+        self.tail = ""
+        self.dirty = False
+        self.prefetched = {}  # offset -> decoded line , filled in while scanning so we don't read those lines twice
+
+    def metaPath(self):
+        return os.path.join(self.index_dir, "meta.json")
+
+    def segmentPath(self, bucket):
+        return os.path.join(self.index_dir, f"users.{bucket}.json")
+
+    def load(self):
+        try:
+            with open(self.metaPath(), 'r') as file:
+                saved = json.load(file)
+        except (FileNotFoundError, NotADirectoryError, json.JSONDecodeError, PermissionError):
+            return False
+        if saved.get("version") != indexVersion or saved.get("source") != self.source_path:
+            return False
+        self.names = set(saved["names"])
+        self.segments = {}
+        self.dirtySegments = set()
+        self.size = saved["size"]
+        self.mtime = saved["mtime"]
+        self.inode = saved["inode"]
+        self.indexed_to = saved["indexed_to"]
+        self.tail = saved["tail"]
+        return True
+
+    def segment(self, bucket):
+        if bucket not in self.segments:
+            try:
+                with open(self.segmentPath(bucket), 'r') as file:
+                    self.segments[bucket] = json.load(file)
+            except (FileNotFoundError, json.JSONDecodeError, PermissionError):
+                self.segments[bucket] = {}
+        return self.segments[bucket]
+
+    def save(self):
+        # segments first , then meta , a reader that sees the new meta also sees the new segments
+        if not self.dirty:
+            return
+        for bucket in sorted(self.dirtySegments):
+            if not writeJsonAtomic(self.segmentPath(bucket), self.segments[bucket], what=f"current_users index {self.index_dir}"):
+                return
+        self.dirtySegments = set()
+        saved = {
+            "version": indexVersion,
+            "source": self.source_path,
+            "size": self.size,
+            "mtime": self.mtime,
+            "inode": self.inode,
+            "indexed_to": self.indexed_to,
+            "tail": self.tail,
+            "names": sorted(self.names),
+        }
+        if writeJsonAtomic(self.metaPath(), saved, what=f"current_users index {self.index_dir}"):
+            self.dirty = False
+
+    def reset(self):
+        # every segment is rewritten , so none from before the rebuild survives
+        self.names = set()
+        self.segments = {bucket: {} for bucket in range(userBuckets)}
+        self.dirtySegments = set(self.segments)
+        self.indexed_to = 0
+        self.tail = ""
+        self.prefetched = {}
+
+    def readTail(self, file, end):
+        start = max(0, end - tailCheckBytes)
+        file.seek(start)
+        return file.read(end - start).hex()
+
+    def stale(self):
+        st = os.stat(self.source_path)
+        return (st.st_size, st.st_mtime, st.st_ino) != (self.size, self.mtime, self.inode)
+
+    def refresh(self, users=()):
+        # Bring the index up to date with current_users.json , returns True if anything had to be scanned
+        st = os.stat(self.source_path)
+        if (st.st_size, st.st_mtime, st.st_ino) == (self.size, self.mtime, self.inode):
+            return False
+
+        with open(self.source_path, 'rb') as file:
+            incremental = (
+                st.st_ino == self.inode
+                and st.st_size >= self.indexed_to
+                and self.readTail(file, self.indexed_to) == self.tail
+            )
+            if not incremental:
+                if Verbose:
+                    print(f"Rebuilding current_users index for {self.source_path}")
+                self.reset()
+            self.scan(file, self.indexed_to, users)
+            self.tail = self.readTail(file, self.indexed_to)
+
+        self.size, self.mtime, self.inode = st.st_size, st.st_mtime, st.st_ino
+        self.dirty = True
+        return True
+
+    def scan(self, file, start, users=()):
+        # Index every complete line from start , decoding only the lines that belong to users
+        size = os.fstat(file.fileno()).st_size
+        if size <= start:
+            return
+        userNeedles = {jsonNeedle(u) for u in users}
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = mm.rfind(b"\n", start, size) + 1   # anything after the last newline is still being written , pick it up next time
+            if end <= start:
+                return
+            workers = usableCpus()
+            if end - start < parallelScanBytes or workers < 2:   # one CPU , the pool would only add pickling
+                results = [scanChunk(self.source_path, start, end, userNeedles)]
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+                bounds = chunkBounds(mm, start, end, workers * chunksPerWorker)
+                if Verbose:
+                    print(f"Scanning {end - start} bytes of {self.source_path} in {len(bounds)} chunks")
+                with ProcessPoolExecutor(max_workers=min(workers, len(bounds))) as executor:
+                    jobs = [executor.submit(scanChunk, self.source_path, a, b, userNeedles) for a, b in bounds]
+                    results = [job.result() for job in jobs]   # keep chunk order so offsets stay sorted
+        for chunk_users, candidates in results:
+            for user, offsets in chunk_users.items():
+                bucket = bucketOf(user)
+                self.segment(bucket).setdefault(user, []).extend(offsets)
+                self.dirtySegments.add(bucket)
+            self.names.update(chunk_users)
+            self.prefetched.update(candidates)
+        self.indexed_to = end
+
+    def offsetsFor(self, users):
+        offsets = set()
+        for user in users:
+            offsets.update(self.segment(bucketOf(user)).get(user, ()))
+        return offsets
+
+    def readRecords(self, offsets, users):
+        # {offset: line} , None if a line isn't from one of users (the offsets don't line up with the file anymore)
+        records = {}
+        with open(self.source_path, 'rb') as file:
+            for offset in sorted(offsets):
+                data = self.prefetched.get(offset)
+                if data is None:
+                    file.seek(offset)
+                    try:
+                        data = json.loads(file.readline())
+                    except json.JSONDecodeError:
+                        return None
+                if not isinstance(data, dict) or data.get("username") not in users:
+                    return None
+                records[offset] = data
+        return records
+
+    def basedirRecords(self, basedirs):
+        # {offset: line} for exact run dirs , through the lines of any user named in the path ,
+        # the rest with a search of the file for the quoted dir (C speed , no per line work in python)
+        found = {}
+        owners = {part for basedir in basedirs for part in pathParts(basedir)} & self.names
+        for offset, data in (self.readRecords(self.offsetsFor(owners), owners) or {}).items():
+            if data.get("basedir") in basedirs:
+                found[offset] = data
+        missing = set(basedirs) - {data.get("basedir") for data in found.values()}
+        if not missing:
+            return found
+        with open(self.source_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for basedir in missing:
+                needle = b'"' + jsonNeedle(basedir) + b'"'
+                pos = mm.find(needle)
+                while pos != -1:
+                    offset, data = lineAt(mm, pos)
+                    if data is not None and data.get("basedir") == basedir:
+                        found[offset] = data
+                    pos = mm.find(needle, pos + len(needle))
+        return found
+
+    def scanBasedirs(self, trie):
+        # {offset: line} for every run dir a selector's prefixes / globs match , one regex pass over the file
+        found = {}
+        with open(self.source_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for match in basedirRegex.finditer(mm):
+                basedir = match.group(1)
+                if basedir is not None:
+                    if not trie.match(pathParts(basedir.decode(errors="replace"))):
+                        continue
+                elif not match.group().strip():
+                    continue
+                try:
+                    data = json.loads(match.group())
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(data, dict) and isinstance(data.get("basedir"), str) and trie.match(pathParts(data["basedir"])):
+                    found[match.start()] = data
+        return found
+
+    def locked(self):
+        # exclusive lock on the index dir while refreshing , two people rebuilding at once would interleave segments
+        os.makedirs(self.index_dir, exist_ok=True)
+        fd = os.open(os.path.join(self.index_dir, "lock"), os.O_RDWR | os.O_CREAT, 0o664)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def unlock(self, fd):
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def update(self, users):
+        # load , and refresh if current_users.json changed (rechecked under the lock , someone may just have done it)
+        self.load()
+        if not self.stale():
+            return
+        try:
+            fd = self.locked()
+        except OSError as e:
+            print(f"Could not lock current_users index {self.index_dir}: {e}")
+            fd = None
+        try:
+            if fd is not None:
+                self.load()
+            self.refresh(users)
+            self.save()
+        finally:
+            if fd is not None:
+                self.unlock(fd)
+
+    def lookup(self, users, basedirs, selector=None):
+        # Returns the parsed current_users.json entries for the users/basedirs we monitor , in file order
+        # With a TileBuilderMonitor_selector.Selector also whatever it matches , limited to what its predicates allow
+        users = set(users)
+        basedirs = set(basedirs)
+        self.update(users)
+        if selector is not None and selector.userGlob is not None:
+            users = users | {user for user in self.names if selector.matchUser(user)}
+        records = self.readRecords(self.offsetsFor(users), users)
+        if records is None:
+            print(f"current_users index out of sync with {self.source_path} , rebuilding")
+            self.size = self.mtime = self.inode = -1
+            self.reset()
+            self.refresh(users)
+            self.save()
+            records = self.readRecords(self.offsetsFor(users), users) or {}
+        if basedirs:
+            records.update(self.basedirRecords(basedirs))
+        if selector is not None and selector.trie:
+            records.update(self.scanBasedirs(selector.trie))
+        records = [records[offset] for offset in sorted(records)]
+        if selector is not None and selector.predicates:
+            records = [record for record in records if selector.matchPredicates(record)]
+        return records
@@ -0,0 +1,180 @@
+import json
+import mmap
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from TileBuilderMonitor_cache import writeJsonAtomic
+
+
+# First error lines of failed target logs , for the run detail window
+# Logs can be several GB and still growing , so they are mmapped and scanned with one compiled pattern ,
+# and every file's result is cached with the offset we scanned up to :
+#   same (size, mtime, inode)     , cached lines , nothing read
+#   grew , same inode             , only the new tail is scanned
+#   shrank or replaced            , scanned again from the start
+# Once a log has excerptLines errors nothing after them matters , growth only costs a stat
+
+excerptLines = 10            # error lines kept per log
+excerptLineBytes = 400       # longer lines are cut , some tools print whole netlists on one line
+logExcerptCacheSize = 2000
+scanWorkers = 2
+
+# <basedir>/logs/<target>.log is where TileBuilder writes target logs
+targetLogPatterns = ["logs/{target}.log", "logs/{target}.log.txt"]
+
+scanChunkBytes = 64 * 1024 * 1024   # mmap is scanned a chunk at a time so a multi-GB log never sits in memory twice
+
+# Cheap literal search first (bytes.find on a lower cased chunk runs at memory speed , a regex alternation doesn't) ,
+# then the compiled pattern decides whether the candidate line really is an error line
+errorNeedles = [b"error", b"fatal", b"-e-", b"traceback (most recent call last)"]
+errorLinePattern = re.compile(
+    rb"[^\S\n]*(?:\*\*)?(?:error|fatal)\b"              # Error: ... / **ERROR ... / FATAL ...
+    rb"|[^\n]*?(?:\bTCL_ERROR\b|-E-|\bTraceback \(most recent call last\))",
+    re.IGNORECASE,
+)
+
+
+def targetLog(basedir, target):
+    # First existing log for the target , None if there isn't one
+    for pattern in targetLogPatterns:
+        path = os.path.join(basedir, pattern.format(target=target))
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def candidateLines(chunk):
+    # Start offsets of lines in chunk that contain an error needle , in file order
+    low = chunk.lower()
+    starts = set()
+    for needle in errorNeedles:
+        pos = low.find(needle)
+        while pos != -1:
+            line_start = low.rfind(b"\n", 0, pos) + 1
+            starts.add(line_start)
+            line_end = low.find(b"\n", pos)
+            if line_end == -1:
+                break
+            pos = low.find(needle, line_end)
+    return sorted(starts)
+
+
+def scanErrors(path, start, limit):
+    # (error lines , offset scanned up to) from start to the last complete line , at most limit lines
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size <= start:
+            return [], start
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = mm.rfind(b"\n", start, size) + 1   # a half written last line is picked up next time
+            if end <= start:
+                return [], start
+            lines = []
+            pos = start
+            while pos < end:
+                chunk_end = min(end, pos + scanChunkBytes)
+                if chunk_end < end:   # whole lines only , a line longer than a chunk gets a chunk to itself
+                    chunk_end = (mm.rfind(b"\n", pos, chunk_end) + 1) or (mm.find(b"\n", chunk_end, end) + 1) or end
+                chunk = mm[pos:chunk_end]
+                for line_start in candidateLines(chunk):
+                    line_end = chunk.find(b"\n", line_start)
+                    line_end = len(chunk) if line_end == -1 else line_end
+                    if not errorLinePattern.match(chunk, line_start, line_end):
+                        continue
+                    lines.append(chunk[line_start:line_end][:excerptLineBytes].decode("utf-8", "replace").rstrip())
+                    if len(lines) >= limit:
+                        return lines, pos + line_end + 1
+                pos = chunk_end
+            return lines, end
+
+
+class LogExcerptCache():
+    # path -> {"size": , "mtime": , "inode": , "offset": , "lines": []} , scans run on a small thread pool
+    # Concurrent requests for one log share a single scan
+
+    def __init__(self, cache_path=None, max_entries=logExcerptCacheSize):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.pending = {}   # (basedir, target) -> Future
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=scanWorkers, thread_name_prefix="tbm-logscan")
+        self.dirty = False
+
+    def load(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, 'r') as file:
+                self.entries = OrderedDict(json.load(file))
+        except (FileNotFoundError, json.JSONDecodeError, PermissionError, TypeError, ValueError):
+            self.entries = OrderedDict()
+
+    def save(self):
+        with self.lock:
+            if not self.dirty or not self.cache_path:
+                return
+            saved = list(self.entries.items())
+        if writeJsonAtomic(self.cache_path, saved):
+            self.dirty = False
+
+    def excerpt(self, path):
+        # Error lines for one log , scanning only what hasn't been scanned yet
+        try:
+            st = os.stat(path)
+        except OSError:
+            return []
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry and entry["inode"] == st.st_ino and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime:
+            with self.lock:
+                self.entries.move_to_end(path)
+            return entry["lines"]
+
+        if entry and entry["inode"] == st.st_ino and entry["offset"] <= st.st_size:
+            lines, offset = list(entry["lines"]), entry["offset"]
+        else:
+            lines, offset = [], 0
+        if len(lines) < excerptLines:
+            found, offset = scanErrors(path, offset, excerptLines - len(lines))
+            lines.extend(found)
+
+        with self.lock:
+            self.entries[path] = {"size": st.st_size, "mtime": st.st_mtime, "inode": st.st_ino, "offset": offset, "lines": lines}
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+        return lines
+
+    def targetExcerpt(self, basedir, target):
+        # (log path , error lines) , (None , []) if the target has no log , runs on the pool so NFS stats stay off the UI thread
+        path = targetLog(basedir, target)
+        return (path, self.excerpt(path)) if path else (None, [])
+
+    def submit(self, basedir, target):
+        # Future for targetExcerpt , one scan in flight per target log
+        key = (basedir, target)
+        with self.lock:
+            future = self.pending.get(key)
+            if future is not None:
+                return future
+            future = self.pending[key] = self.executor.submit(self.targetExcerpt, basedir, target)
+
+        def finished(_):
+            with self.lock:
+                self.pending.pop(key, None)
+
+        future.add_done_callback(finished)
+        return future
+
+    def failedTargets(self, record):
+        # {target: Future of (log path , error lines)} for every failed target of a run record
+        basedir = record.get("basedir") or ""
+        return {target: self.submit(basedir, target) for target in record.get("FAILED_TARGETS") or []}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
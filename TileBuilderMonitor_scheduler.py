@@ -0,0 +1,94 @@
+import contextvars
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+# One scheduler for the whole backend
+# Work is split into lanes by what it hammers , each lane has its own concurrency limit:
+#   nfs   , params.json reads and other file system probing
+#   seras , serascmd queries against TB_SRV_DIR servers
+#   fc    , fc_shell / compare_qor_data jobs
+# Tasks can be submitted after other tasks so the pipeline runs as a graph (parse -> params -> status -> QoR)
+
+defaultLimits = {"nfs": 16, "seras": 4, "fc": 4}
+
+
+class Scheduler():
+    def __init__(self, limits=None):
+        self.limits = dict(defaultLimits)
+        for lane, limit in (limits or {}).items():
+            if limit:
+                self.limits[lane] = max(1, int(limit))
+        self.executors = {
+            lane: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"tbm-{lane}")
+            for lane, limit in self.limits.items()
+        }
+
+    def submit(self, lane, fn, *args, after=(), **kwargs):
+        # Run fn on the lane once every future in after is done , a failed dependency doesn't stop fn from running
+        after = [dep for dep in after if dep is not None]
+        executor = self.executors[lane]
+        context = contextvars.copy_context()   # so a --profile span opened by the submitter is the task's parent
+        if not after:
+            return executor.submit(context.run, fn, *args, **kwargs)
+
+        future = Future()
+        remaining = [len(after)]
+        lock = threading.Lock()
+
+        def copyResult(inner):
+            if inner.exception() is not None:
+                future.set_exception(inner.exception())
+            else:
+                future.set_result(inner.result())
+
+        def ready(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                executor.submit(context.run, fn, *args, **kwargs).add_done_callback(copyResult)
+            except RuntimeError as e:   # scheduler shut down underneath us
+                future.set_exception(e)
+
+        for dep in after:
+            dep.add_done_callback(ready)
+        return future
+
+    @staticmethod
+    def whenAll(futures, callback):
+        # callback() once every future is done , right away if there are none
+        futures = list(futures)
+        if not futures:
+            callback()
+            return
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            callback()
+
+        for future in futures:
+            future.add_done_callback(done)
+
+    @staticmethod
+    def wait(futures):
+        # Wait for everything and print failures rather than raise , one broken run shouldn't take down the rest
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"Error occurred: {e}")
+        return results
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
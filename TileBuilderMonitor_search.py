@@ -0,0 +1,193 @@
+import re
+from bisect import bisect_left
+
+from TileBuilderMonitor_selector import Selector, isGlob, pathParts, predicateFields
+
+
+# In memory inverted index over run records for the GUI search bar
+# Every searchable field is split into lower case tokens , each token points at the set of runs that have it
+# A query is whitespace separated terms that must all match , each term is a token prefix ,
+# optionally limited to one field with field:term , e.g.  failed:fxplace  tile:gfx  lab0
+# Terms with separators in them (a/b , x_y) must match every piece
+# Run dirs (/proj/.../run , /proj/.../ for everything under it) and globs on user/tile/label/nick (user:a* , tile:gfx_*)
+# go through the same compiled selector as -u / -r , see TileBuilderMonitor_selector
+
+tokenSplitter = re.compile(r"[/\s,._\-:]+")
+
+# field -> how to get its values out of a record
+searchFields = {
+    "basedir": lambda r: [r.get("basedir")],
+    "tilename": lambda r: [r.get("tilename")],
+    "nickname": lambda r: [r.get("nickname")],
+    "label": lambda r: [r.get("label")],
+    "user": lambda r: [r.get("username")],
+    "flow": lambda r: [r.get("FLOW_DIR")],
+    "running": lambda r: r.get("RUNNING_TARGETS") or [],
+    "failed": lambda r: r.get("FAILED_TARGETS") or [],
+}
+
+fieldAliases = {
+    "dir": "basedir", "run": "basedir",
+    "tile": "tilename",
+    "nick": "nickname",
+    "username": "user",
+    "flow_dir": "flow",
+    "running_targets": "running",
+    "fail": "failed", "failed_targets": "failed",
+    "target": ("running", "failed"),
+}
+
+
+selectorFields = {"user"} | set(predicateFields)
+
+
+def selectorTerm(raw):
+    # True for terms that are -r style selector entries rather than token prefixes
+    if raw.startswith("/"):
+        return True
+    field, sep, value = raw.partition(":")
+    return bool(sep) and field in selectorFields and isGlob(value)
+
+
+def tokens(value):
+    # The whole value plus its pieces , so both "fxplace" and "place" style prefixes work on compound names
+    if value is None:
+        return set()
+    value = str(value).lower()
+    found = {tok for tok in tokenSplitter.split(value) if tok}
+    if value.strip():
+        found.add(value.strip())
+    return found
+
+
+class RunSearchIndex():
+    def __init__(self, records=()):
+        self.records = []                  # id -> record
+        self.ids = {}                      # id(record) -> id , records are updated in place while streaming
+        self.postings = {field: {} for field in searchFields}   # field -> token -> {ids}
+        self.recordTokens = []             # id -> [(field, token)] , to take a record out again on update
+        self.recordParts = []              # id -> basedir path components , for selector terms
+        self.vocab = {}                    # field -> sorted tokens , rebuilt lazily after a change
+        self.termCache = {}                # (field, term) -> frozenset(ids) , typing usually extends the last query
+        for record in records:
+            self.add(record)
+
+    def add(self, record):
+        key = id(record)
+        if key in self.ids:
+            return self.update(record)
+        rid = len(self.records)
+        self.records.append(record)
+        self.ids[key] = rid
+        self.recordTokens.append([])
+        self.recordParts.append(None)
+        self.index(rid, record)
+        return rid
+
+    def update(self, record):
+        # Record changed in place (targets or link filled in) , drop its old tokens and index it again
+        rid = self.ids.get(id(record))
+        if rid is None:
+            return self.add(record)
+        for field, token in self.recordTokens[rid]:
+            ids = self.postings[field].get(token)
+            if ids is not None:
+                ids.discard(rid)
+                if not ids:
+                    del self.postings[field][token]
+                    self.vocab.pop(field, None)
+        self.recordTokens[rid] = []
+        self.index(rid, record)
+        return rid
+
+    def index(self, rid, record):
+        entries = self.recordTokens[rid]
+        self.recordParts[rid] = pathParts(record.get("basedir") or "")
+        for field, values in searchFields.items():
+            postings = self.postings[field]
+            for value in values(record):
+                for token in tokens(value):
+                    ids = postings.get(token)
+                    if ids is None:
+                        ids = postings[token] = set()
+                        self.vocab.pop(field, None)
+                    ids.add(rid)
+                    entries.append((field, token))
+        self.termCache.clear()
+
+    def prefixMatch(self, field, prefix):
+        vocab = self.vocab.get(field)
+        if vocab is None:
+            vocab = self.vocab[field] = sorted(self.postings[field])
+        postings = self.postings[field]
+        matched = set()
+        i = bisect_left(vocab, prefix)
+        while i < len(vocab) and vocab[i].startswith(prefix):
+            matched |= postings[vocab[i]]
+            i += 1
+        return matched
+
+    def termMatch(self, fields, term):
+        key = (fields, term)
+        cached = self.termCache.get(key)
+        if cached is not None:
+            return cached
+        result = None
+        for piece in [tok for tok in tokenSplitter.split(term) if tok] or [term]:
+            matched = set()
+            for field in fields:
+                matched |= self.prefixMatch(field, piece)
+            result = matched if result is None else result & matched
+            if not result:
+                break
+        result = frozenset(result or ())
+        self.termCache[key] = result
+        return result
+
+    def parse(self, query):
+        # [(fields, term)] , unknown qualifiers are searched as plain text
+        terms = []
+        for raw in query.lower().split():
+            field, sep, term = raw.partition(":")
+            fields = fieldAliases.get(field, field) if sep else None
+            if isinstance(fields, str):
+                fields = (fields,)
+            if fields is None or not all(f in searchFields for f in fields):
+                fields, term = tuple(searchFields), raw
+            if term:
+                terms.append((fields, term))
+        return terms
+
+    def selectorMatch(self, entries):
+        # ids the selector picks , paths and globs are case sensitive so entries keep the case they were typed in
+        key = ("selector", entries)
+        cached = self.termCache.get(key)
+        if cached is None:
+            selector = Selector(runs=entries)
+            cached = self.termCache[key] = frozenset(selector.matchIds(self.records, self.recordParts))
+        return cached
+
+    def search(self, query):
+        # Ids of matching records in load order , None for an empty query (everything matches)
+        raw_terms = (query or "").split()
+        entries = tuple(raw for raw in raw_terms if selectorTerm(raw))
+        terms = self.parse(" ".join(raw for raw in raw_terms if not selectorTerm(raw)))
+        if not terms and not entries:
+            return None
+        # Most selective term first so the intersections stay small
+        matches = [self.termMatch(fields, term) for fields, term in terms]
+        if entries:
+            matches.append(self.selectorMatch(entries))
+        matches.sort(key=len)
+        result = set(matches[0])
+        for matched in matches[1:]:
+            result &= matched
+            if not result:
+                break
+        return sorted(result)
+
+    def filter(self, query):
+        ids = self.search(query)
+        if ids is None:
+            return list(self.records)
+        return [self.records[rid] for rid in ids]
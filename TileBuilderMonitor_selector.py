@@ -0,0 +1,238 @@
+import os
+import re
+from fnmatch import translate
+
+
+# Run selector , what -u and -r compile to
+# Sources , a run is picked if any of them matches (as before , users OR runs) :
+#   user names          alice , a*                         (-u , or user:NAME in -r)
+#   exact run dirs      /proj/gfx/alice/run1               (what a -r file used to hold)
+#   dir prefixes        /proj/gfx/alice/                   everything under it (trailing / or /**)
+#   path globs          /proj/*/alice/run_gfx*             one path component per * , ** for any depth
+# Predicates , narrow down whatever the sources picked (OR within a field , AND across fields) :
+#   tile:gfx_*  label:lab0  nick:n1                        (tilename: / nickname: work too)
+# -r takes a file of entries (one per line , # comments at the start of a line or after a space) or the entries
+# themselves , comma separated
+#
+# Exact names and dirs are hashed sets , prefixes and the literal head of every glob live in a trie of path
+# components , so matching a run costs one walk down its basedir , no matter how many entries there are
+
+globChars = frozenset("*?[")
+predicateFields = {
+    "tile": "tilename", "tilename": "tilename",
+    "label": "label",
+    "nick": "nickname", "nickname": "nickname",
+}
+prefixMark = "**"
+commentRegex = re.compile(r"(?:^|\s)#.*")   # a # inside a path (run#2) is part of the path
+
+
+def isGlob(text):
+    return not globChars.isdisjoint(text)
+
+
+def pathParts(path):
+    # /proj//gfx/./run/ -> ["proj", "gfx", "run"] , the trie and the sets work on component lists
+    return [part for part in str(path).split("/") if part and part != "."]
+
+
+def componentRegex(pattern):
+    # one path component glob -> regex , * ? and [...] never match a /
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[" and pattern.find("]", i + 1) != -1:
+            end = pattern.find("]", i + 1)
+            body = pattern[i:end].replace("\\", "\\\\")
+            out.append("[^" + body[1:] + "]" if body.startswith("!") else "[" + body + "]")
+            i = end + 1
+        else:
+            out.append(re.escape(c))
+    return "".join(out)
+
+
+def compileTail(patterns):
+    # glob components -> one compiled fullmatch for the rest of the path joined with / , ** is zero or more components
+    regex = ""
+    for i, pattern in enumerate(patterns):
+        last = i == len(patterns) - 1
+        if pattern != prefixMark:
+            regex += componentRegex(pattern) + ("" if last else "/")
+        elif not last:
+            regex += "(?:[^/]+/)*"
+        else:
+            regex = regex[:-1] + "(?:/.*)?" if regex else ".*"
+    return re.compile(regex).fullmatch
+
+
+class PathTrie():
+    # path components -> node , a node knows if a prefix ends there and which glob tails hang off it
+    __slots__ = ("children", "prefix", "globs")
+
+    def __init__(self):
+        self.children = {}
+        self.prefix = False
+        self.globs = []   # fullmatch for the rest of the path , one per glob hanging off this node
+
+    def insert(self, parts, glob_tail=None):
+        node = self
+        for part in parts:
+            node = node.children.setdefault(part, PathTrie())
+        if glob_tail:
+            node.globs.append(compileTail(glob_tail))
+        else:
+            node.prefix = True
+
+    def match(self, parts):
+        # O(depth) walk , globs are only tried at the nodes the path actually passes through
+        node = self
+        for depth in range(len(parts) + 1):
+            if node.prefix:
+                return True
+            if node.globs:
+                rest = "/".join(parts[depth:])
+                if any(glob_tail(rest) is not None for glob_tail in node.globs):
+                    return True
+            if depth == len(parts):
+                return False
+            node = node.children.get(parts[depth])
+            if node is None:
+                return False
+        return False
+
+    def __bool__(self):
+        return self.prefix or bool(self.globs) or bool(self.children)
+
+
+def compileGlobs(globs):
+    # one regex for a list of globs , None for none
+    return re.compile("|".join(translate(glob) for glob in globs)) if globs else None
+
+
+def readEntries(value):
+    # -r value -> entries , a file of them if it names one , else the value itself comma separated
+    if not value:
+        return []
+    if os.path.isfile(value):
+        with open(value, 'r') as file:
+            lines = [commentRegex.sub("", line).strip() for line in file]
+        return [line for line in lines if line]
+    return [entry.strip() for entry in value.split(",") if entry.strip()]
+
+
+class Selector():
+    def __init__(self, users=(), runs=()):
+        self.users = set()          # exact user names
+        self.userGlob = None        # one compiled alternation for every user glob
+        self.basedirs = set()       # exact run dirs as normalized component tuples
+        self.rawBasedirs = set()    # and as they were written , for hash lookups on current_users.json keys
+        self.trie = PathTrie()      # dir prefixes and path globs
+        self.predicates = {}        # record field -> (exact values , compiled glob or None)
+        users = list(users)
+        user_globs = []
+        field_values = {}
+        for entry in runs:
+            field, sep, value = entry.partition(":")
+            if sep and field == "user":
+                users.append(value)
+            elif sep and field in predicateFields:
+                field_values.setdefault(predicateFields[field], []).append(value)
+            else:
+                self.addPath(entry)
+        for user in users:
+            if isGlob(user):
+                user_globs.append(user)
+            else:
+                self.users.add(user)
+        self.userGlob = compileGlobs(user_globs)
+        for field, values in field_values.items():
+            self.predicates[field] = ({value for value in values if not isGlob(value)},
+                                      compileGlobs([value for value in values if isGlob(value)]))
+
+    def addPath(self, entry):
+        parts = pathParts(entry)
+        if entry.endswith("/"):
+            parts.append(prefixMark)
+        # **/** is the same as one ** (and the tail regex can't take two in a row)
+        parts = [part for i, part in enumerate(parts) if not (part == prefixMark and i and parts[i - 1] == prefixMark)]
+        literal = []
+        for i, part in enumerate(parts):
+            if part == prefixMark and i == len(parts) - 1:
+                self.trie.insert(literal)   # a plain prefix , no glob to check below it
+                return
+            if isGlob(part):
+                self.trie.insert(literal, parts[i:])
+                return
+            literal.append(part)
+        self.basedirs.add(tuple(literal))
+        self.rawBasedirs.add(entry)
+
+    def hasSources(self):
+        return bool(self.users or self.userGlob is not None or self.basedirs or self.trie)
+
+    def matchUser(self, user):
+        return user in self.users or (self.userGlob is not None and user is not None and self.userGlob.match(user) is not None)
+
+    def matchBasedir(self, basedir, parts=None):
+        # parts , pathParts(basedir) if the caller already has them
+        if basedir is None or not (self.basedirs or self.trie):
+            return False
+        parts = pathParts(basedir) if parts is None else parts
+        return tuple(parts) in self.basedirs or self.trie.match(parts)
+
+    def matchPredicates(self, record):
+        for field, (exact, glob) in self.predicates.items():
+            value = record.get(field)
+            if value is None:
+                return False
+            value = str(value)
+            if value not in exact and (glob is None or glob.match(value) is None):
+                return False
+        return True
+
+    def match(self, record, parts=None):
+        # one current_users.json entry (or snapshot record) , a selector with only predicates picks whatever they allow
+        picked = (not self.hasSources() or self.matchUser(record.get("username"))
+                  or self.matchBasedir(record.get("basedir"), parts))
+        return picked and self.matchPredicates(record)
+
+    def matchIds(self, records, parts_list=None):
+        # positions of the records it picks , same as match() with everything that doesn't depend on the record
+        # worked out once , the GUI runs this over every run on a keystroke
+        sources = self.hasSources()
+        users, user_glob = self.users, self.userGlob
+        basedirs, trie = self.basedirs, (self.trie if self.trie else None)
+        check_paths = bool(basedirs) or trie is not None
+        predicates = self.predicates
+        ids = []
+        for rid, record in enumerate(records):
+            if sources:
+                user = record.get("username")
+                picked = user in users or (user_glob is not None and user is not None and user_glob.match(user) is not None)
+                if not picked and check_paths:
+                    parts = parts_list[rid] if parts_list is not None else pathParts(record.get("basedir") or "")
+                    picked = tuple(parts) in basedirs or (trie is not None and trie.match(parts))
+                if not picked:
+                    continue
+            if predicates and not self.matchPredicates(record):
+                continue
+            ids.append(rid)
+        return ids
+
+    def exactUsers(self):
+        return set(self.users)
+
+    def exactBasedirs(self):
+        # the exact dirs as written and normalized , current_users.json keys are compared as strings
+        return self.rawBasedirs | {"/" + "/".join(parts) for parts in self.basedirs}
+
+    def needsScan(self):
+        # True if some source can only be answered by looking at every user / basedir , not by a hash lookup
+        return self.userGlob is not None or bool(self.trie)
+
@@ -0,0 +1,249 @@
+import atexit
+import os
+import select
+import signal
+import subprocess
+import threading
+import time
+
+
+# Warm tcsh coprocesses , one per environment
+# Sourcing $TB_SRV_DIR/.cshrc or doing a module load costs more than the serascmd / fc_shell call itself ,
+# so we source once and then feed commands to the same shell over stdin
+# Each command is followed by an echo of a sentinel and $status so we know where its output ends
+
+sessionTTL = 300        # seconds a shell can sit idle before it is closed
+maxPerEnvironment = 4   # concurrent shells for one environment , extra callers wait for one to free up
+
+Verbose = False
+
+
+class SessionError(Exception):
+    pass
+
+
+class TcshSession():
+    def __init__(self, setup):
+        self.setup = setup
+        self.sentinel = f"__TBM_DONE_{os.urandom(16).hex()}__".encode()   # uuid would pull in platform at import
+        self.proc = subprocess.Popen(
+            ["tcsh"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+            start_new_session=True,   # own process group , closing the session also kills whatever it is running
+        )
+        self.buffer = b""
+        self.last_used = time.time()
+        self.setup_status = self.run(setup, subshell=False)[0] if setup else 0   # sourced into the shell itself , that is the point
+        if self.setup_status != 0:
+            print(f"Environment setup exited with {self.setup_status}: {setup}")
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def send(self, cmd, subshell=True):
+        # run in a subshell with stdin closed so a command can't eat the rest of our input or cd us somewhere
+        # (not the environment setup , whatever it sets has to stay for the commands after it)
+        framed = f"( {cmd} ) < /dev/null" if subshell else cmd
+        framed = f"{framed}\necho {self.sentinel.decode()} $status\n"
+        try:
+            self.proc.stdin.write(framed.encode())
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise SessionError(f"tcsh session died: {e}")
+
+    def readChunk(self, deadline):
+        timeout = None if deadline is None else max(0.0, deadline - time.time())
+        ready, _, _ = select.select([self.proc.stdout], [], [], timeout)
+        if not ready:
+            self.close()
+            raise TimeoutError("command timed out in tcsh session")
+        chunk = os.read(self.proc.stdout.fileno(), 65536)
+        if not chunk:
+            raise SessionError("tcsh session closed its output")
+        return chunk
+
+    def lines(self, cmd, timeout=None, subshell=True):
+        # Yields the command's output line by line as it arrives , then the exit status as the last item (an int)
+        self.send(cmd, subshell)
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            while b"\n" not in self.buffer:
+                self.buffer += self.readChunk(deadline)
+            # every complete line in the buffer at once , splitting one line off at a time copies the rest of a 64k chunk per line
+            lines = self.buffer.split(b"\n")
+            self.buffer = lines.pop()   # partial last line , completed by the next chunk
+            for i, line in enumerate(lines):
+                mark = line.find(self.sentinel)
+                if mark == -1:
+                    yield line.decode(errors="replace")
+                    continue
+                if mark > 0:
+                    yield line[:mark].decode(errors="replace")   # output that didn't end in a newline
+                self.buffer = b"\n".join(lines[i + 1:] + [self.buffer])
+                self.last_used = time.time()
+                try:
+                    yield int(line[mark + len(self.sentinel):].strip() or 0)
+                except ValueError:
+                    yield 1
+                return
+
+    def run(self, cmd, timeout=None, subshell=True):
+        output = []
+        status = 1
+        for item in self.lines(cmd, timeout, subshell):
+            if isinstance(item, int):
+                status = item
+            else:
+                output.append(item)
+        return status, "\n".join(output)
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        try:
+            self.proc.kill()
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+
+class SessionPool():
+    def __init__(self, ttl=sessionTTL, max_per_key=maxPerEnvironment):
+        self.ttl = ttl
+        self.max_per_key = max_per_key
+        self.idle = {}     # key -> [sessions waiting for work]
+        self.busy = {}     # key -> number of sessions handed out
+        self.cond = threading.Condition()
+        self.reaper = None
+        self.started = 0   # shells started , handy to see how much the pool saves
+        self.handed = set()   # sessions out with a caller right now , cancel() kills those too
+        self.closed = False
+
+    def acquire(self, key, setup):
+        with self.cond:
+            self.startReaper()
+            while True:
+                if self.closed:
+                    raise SessionError("session pool is closed")
+                idle = self.idle.get(key, [])
+                while idle:
+                    session = idle.pop()
+                    if session.alive():
+                        self.busy[key] = self.busy.get(key, 0) + 1
+                        self.handed.add(session)
+                        return session
+                    session.close()
+                if self.busy.get(key, 0) < self.max_per_key:
+                    self.busy[key] = self.busy.get(key, 0) + 1
+                    break
+                self.cond.wait()
+        try:
+            if Verbose:
+                print(f"Starting tcsh session for {key}")
+            session = TcshSession(setup)
+            with self.cond:
+                self.started += 1
+                self.handed.add(session)
+                closed = self.closed
+            if closed:   # cancelled while the shell was starting
+                self.release(key, session, healthy=False)
+                raise SessionError("session pool is closed")
+            return session
+        except Exception:
+            with self.cond:
+                self.busy[key] -= 1
+                self.cond.notify_all()
+            raise
+
+    def release(self, key, session, healthy=True):
+        with self.cond:
+            self.busy[key] -= 1
+            self.handed.discard(session)
+            if healthy and session.alive() and not self.closed:
+                self.idle.setdefault(key, []).append(session)
+            else:
+                session.close()
+            self.cond.notify_all()
+
+    def lines(self, key, setup, cmd, timeout=None):
+        # Same as TcshSession.lines but borrows a warm shell for the environment key
+        session = self.acquire(key, setup)
+        healthy = False
+        try:
+            yield from session.lines(cmd, timeout)
+            healthy = True
+        finally:
+            self.release(key, session, healthy)   # a command abandoned half way leaves output in the pipe , don't reuse that shell
+
+    def run(self, key, setup, cmd, timeout=None):
+        session = self.acquire(key, setup)
+        healthy = False
+        try:
+            result = session.run(cmd, timeout)
+            healthy = True
+            return result
+        finally:
+            self.release(key, session, healthy)
+
+    def evictIdle(self):
+        now = time.time()
+        with self.cond:
+            for key, sessions in self.idle.items():
+                keep = []
+                for session in sessions:
+                    if now - session.last_used > self.ttl or not session.alive():
+                        session.close()
+                    else:
+                        keep.append(session)
+                self.idle[key] = keep
+
+    def startReaper(self):
+        if self.reaper is not None:
+            return
+
+        def reap():
+            while True:
+                time.sleep(max(1.0, self.ttl / 4))
+                self.evictIdle()
+
+        self.reaper = threading.Thread(target=reap, name="tcsh-session-reaper", daemon=True)
+        self.reaper.start()
+
+    def cancel(self):
+        # Shutting down : kill every shell , busy ones included so a running serascmd / fc_shell stops now ,
+        # whoever was reading from one gets a SessionError , and any later acquire fails straight away
+        with self.cond:
+            self.closed = True
+            sessions = [session for idle in self.idle.values() for session in idle] + list(self.handed)
+            self.idle.clear()
+            self.cond.notify_all()
+        for session in sessions:
+            session.close()
+
+    def closeAll(self):
+        with self.cond:
+            for sessions in self.idle.values():
+                for session in sessions:
+                    session.close()
+            self.idle.clear()
+
+
+pool = SessionPool()
+atexit.register(pool.closeAll)
+
+
+def tbKey(tb_srv_dir):
+    return ("TB_SRV_DIR", tb_srv_dir), f"source {tb_srv_dir}/.cshrc"
+
+
+def fcKey(fc_module):
+    return ("FC_MODULE", fc_module), f"module load {fc_module}"
@@ -0,0 +1,173 @@
+import json
+import os
+import time
+
+
+# Snapshot helpers shared by the backend and anything reading its output
+# A snapshot (tmp.json) is compact NDJSON : a header line then one run record per line ,
+# written to a temp file and renamed into place so a reader never sees half of one
+# Every backend run is also diffed against the previous snapshot and the changes are appended to events.jsonl ,
+# so consumers can apply just the changes instead of reloading every run
+
+snapshotFormat = "tilebuildermonitor-snapshot"
+snapshotVersion = 1
+eventsName = "events.jsonl"
+eventsRotateBytes = 50 * 1024 * 1024   # events.jsonl is moved to events.jsonl.1 past this size
+statusUnknown = "STATUS_UNKNOWN"   # set on a run record when its server's serascmd failed , its targets are not news
+
+
+def writeSnapshot(path, records, ts=None):
+    ts = time.time() if ts is None else ts
+    from TileBuilderMonitor_cache import writeAtomic   # only the backend writes snapshots , the frontend just reads them
+    header = {"format": snapshotFormat, "version": snapshotVersion, "created": ts, "runs": len(records)}
+
+    def write(file):
+        file.write(json.dumps(header, separators=(",", ":")) + "\n")
+        for record in records:
+            file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    writeAtomic(path, write)
+    return header
+
+
+def iterSnapshot(path):
+    # Yields run records one line at a time , raises OSError if the file can't be opened
+    # Files from before the header existed (concatenated pretty printed objects) go through readLegacy
+    with open(path, 'r') as file:
+        first = file.readline()
+        while first and not first.strip():
+            first = file.readline()
+        if not first:
+            return
+        try:
+            header = json.loads(first)
+        except json.JSONDecodeError:
+            header = None
+        if not (isinstance(header, dict) and header.get("format") == snapshotFormat):
+            file.seek(0)
+            yield from readLegacy(file.read())
+            return
+        if header.get("version", 0) > snapshotVersion:
+            print(f"{path} is snapshot version {header.get('version')} , newer than this reader ({snapshotVersion})")
+        for lineno, line in enumerate(file, start=2):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping bad record on line {lineno} of {path}")
+                continue
+            if isinstance(record, dict):
+                yield record
+
+
+def readSnapshot(path):
+    # Records from a snapshot file , [] if it isn't there
+    try:
+        return list(iterSnapshot(path))
+    except OSError:
+        return []
+
+
+def readLegacy(text):
+    # Old tmp.json , pretty printed objects back to back with no separator , maybe with // comment lines
+    text = "\n".join(ln for ln in text.splitlines() if not ln.strip().startswith("//"))
+    records = []
+    dec = json.JSONDecoder()
+    idx = 0
+    n = len(text)
+    while idx < n:
+        while idx < n and text[idx].isspace():
+            idx += 1
+        if idx >= n:
+            break
+        try:
+            obj, idx = dec.raw_decode(text, idx)
+        except json.JSONDecodeError:
+            nxt = text.find("{", idx + 1)   # skip to the next object instead of crawling one character at a time
+            if nxt == -1:
+                break
+            idx = nxt
+            continue
+        if isinstance(obj, dict):
+            records.append(obj)
+        elif isinstance(obj, list):
+            records.extend(r for r in obj if isinstance(r, dict))
+    return records
+
+
+def runKey(record):
+    return record.get("basedir")
+
+
+def carryStatus(previous, records):
+    # Runs whose status couldn't be fetched keep the targets of their last snapshot (still flagged) ,
+    # so the next good refresh is diffed against what we last knew rather than against an empty run
+    prev = {runKey(r): r for r in previous if runKey(r)}   # a flagged one already carries what was known before it
+    out = []
+    for record in records:
+        old = prev.get(runKey(record)) if record.get(statusUnknown) else None
+        if old is not None:
+            record = dict(record, RUNNING_TARGETS=old.get("RUNNING_TARGETS") or [], FAILED_TARGETS=old.get("FAILED_TARGETS") or [])
+        out.append(record)
+    return out
+
+
+def diffSnapshots(previous, current, ts=None):
+    # Per run changes between two lists of run records
+    #   run_appeared / run_disappeared
+    #   target_started   , newly in RUNNING_TARGETS
+    #   target_failed    , newly in FAILED_TARGETS
+    #   target_finished  , was running , now neither running nor failed
+    #   target_cleared   , was failed , now neither running nor failed (rerun or cleaned up)
+    # Runs flagged statusUnknown only get run_appeared / run_disappeared , a failed query is not a finished target
+    ts = time.time() if ts is None else ts
+    prev = {runKey(r): r for r in previous if runKey(r)}
+    cur = {runKey(r): r for r in current if runKey(r)}
+    events = []
+
+    def event(kind, record, target=None):
+        ev = {"ts": ts, "event": kind, "basedir": runKey(record), "tilename": record.get("tilename"), "FLOW_DIR": record.get("FLOW_DIR")}
+        if target is not None:
+            ev["target"] = target
+        events.append(ev)
+
+    for basedir, record in cur.items():
+        if basedir not in prev:
+            event("run_appeared", record)
+        if record.get(statusUnknown):
+            continue
+        old = prev.get(basedir, {})
+        was_running = set(old.get("RUNNING_TARGETS") or [])
+        was_failed = set(old.get("FAILED_TARGETS") or [])
+        running = set(record.get("RUNNING_TARGETS") or [])
+        failed = set(record.get("FAILED_TARGETS") or [])
+        for target in sorted(running - was_running):
+            event("target_started", record, target)
+        for target in sorted(failed - was_failed):
+            event("target_failed", record, target)
+        for target in sorted(was_running - running - failed):
+            event("target_finished", record, target)
+        for target in sorted(was_failed - failed - running):
+            event("target_cleared", record, target)
+
+    for basedir, record in prev.items():
+        if basedir not in cur:
+            event("run_disappeared", record)
+    return events
+
+
+def appendEvents(out_dir, events, runs, ts=None):
+    # Append the changes plus a snapshot marker , the marker is written even with no changes so readers know a refresh happened
+    path = os.path.join(out_dir, eventsName)
+    ts = time.time() if ts is None else ts
+    try:
+        if os.path.getsize(path) > eventsRotateBytes:
+            os.replace(path, path + ".1")
+    except OSError:
+        pass
+    with open(path, 'a') as file:
+        for ev in events:
+            file.write(json.dumps(ev, separators=(",", ":")) + "\n")
+        file.write(json.dumps({"ts": ts, "event": "snapshot", "runs": runs, "changes": len(events)}, separators=(",", ":")) + "\n")
+    return path
@@ -0,0 +1,112 @@
+import json
+import os
+import queue
+import socket
+import tempfile
+import threading
+import time
+
+
+# Backend -> frontend streaming over a local Unix domain socket
+# The frontend listens , the backend connects and writes one json message per line as work completes:
+#   {"type": "workspace", "FLOW_DIR": ..., "state": "loading" | "done"}
+#   {"type": "run", "record": {...}}         , sent again with the same basedir when the record changes (QoR link)
+#   {"type": "done", "runs": n}             , "failed": n too from a coordinator with shards that didn't come back
+#   {"type": "worker"}                       , first message of a coordinator worker : its connection ending is not the
+#                                              end of the stream , the coordinator holds its own and sends done
+#   {"type": "detach"}                       , a coordinator worker finished its share , someone else sends done
+# Messages land on a queue.Queue so the Tk side can drain them with root.after
+
+connectTimeout = 60   # seconds the backend keeps trying to reach the frontend , Tk can be slow to come up over X
+
+
+def socketPath(user):
+    # Unix socket paths are limited to ~100 bytes , the checkout can be nested deeper than that so use the temp dir
+    return os.path.join(tempfile.gettempdir(), f"TileBuilderMonitor-{user}-{os.getpid()}.sock")
+
+
+class StreamServer():
+    def __init__(self, path, messages=None):
+        self.path = path
+        self.messages = messages if messages is not None else queue.Queue()
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(path)
+        self.sock.listen(4)
+        self.thread = threading.Thread(target=self.serve, name="tbm-stream", daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return   # closed
+            threading.Thread(target=self.read, args=(conn,), daemon=True).start()
+
+    def read(self, conn):
+        finished = False
+        worker = False
+        with conn, conn.makefile('r', encoding="utf-8") as stream:
+            for line in stream:
+                if not line.strip():
+                    continue
+                try:
+                    message = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                kind = message.get("type")
+                if kind == "worker":
+                    worker = True
+                    continue
+                finished = finished or kind in ("done", "detach")
+                if kind != "detach":
+                    self.messages.put(message)
+        if not finished and not worker:
+            self.messages.put({"type": "closed"})   # backend went away without saying it was done
+
+    def close(self):
+        try:
+            self.sock.close()
+        finally:
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class StreamClient():
+    def __init__(self, path, timeout=connectTimeout):
+        self.path = path
+        self.lock = threading.Lock()
+        self.sock = None
+        deadline = time.time() + timeout
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+                self.sock = sock
+                return
+            except OSError:
+                sock.close()
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def send(self, message):
+        data = (json.dumps(message, separators=(",", ":")) + "\n").encode()
+        with self.lock:
+            self.sock.sendall(data)
+
+    def close(self):
+        with self.lock:
+            if self.sock is not None:
+                try:
+                    self.sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                self.sock.close()
+                self.sock = None
@@ -0,0 +1,181 @@
+import contextvars
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+
+# Tracing spans for --profile
+# with trace.span("serascmd", server=tb_srv_dir): ...   records a Chrome trace event (ph "X") with its attributes
+# Spans nest through a contextvar , so the parent is right for threads and for asyncio tasks alike
+# Off by default , a disabled span is one shared no-op object so the instrumentation can stay in hot paths
+#
+# export() writes trace.json for chrome://tracing or https://ui.perfetto.dev ,
+# summary() gives count / total / p50 / p90 / p99 / max per stage , and per server for spans that carry one
+# (params.json reads carry their NFS mount , serascmd its TB_SRV_DIR) so a slow server stands out
+
+traceName = "trace.json"
+summaryName = "trace_summary.txt"
+serverDepth = 3   # /proj/<project> , path components that identify the NFS mount a file lives on
+
+enabled = False
+events = []
+lock = threading.Lock()
+current = contextvars.ContextVar("tbm_span", default=None)
+origin = time.perf_counter_ns()
+originWall = time.time_ns()   # timestamps are wall clock based so spans from coordinator workers line up
+taskIds = {}   # id(asyncio task) -> small fake tid , so concurrent coroutines get their own rows
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def nfsServer(path):
+    # /proj/foo/bar/run/params.json -> /proj/foo
+    parts = [p for p in str(path).split("/") if p]
+    return "/" + "/".join(parts[:serverDepth - 1])
+
+
+def laneId():
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is not None:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:   # no running loop in this thread
+            task = None
+        if task is not None:
+            with lock:
+                return taskIds.setdefault(id(task), 1_000_000 + len(taskIds))
+    return threading.get_native_id()
+
+
+class Span():
+    __slots__ = ("name", "attrs", "start", "token", "parent")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.parent = current.get()
+        self.token = current.set(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        current.reset(self.token)
+        args = {key: value if isinstance(value, (int, float, bool, str)) or value is None else str(value)
+                for key, value in self.attrs.items()}
+        if self.parent is not None:
+            args["parent"] = self.parent.name
+        if exc_type is not None:
+            args["error"] = exc_type.__name__
+        event = {
+            "name": self.name,
+            "cat": self.name,
+            "ph": "X",
+            "ts": (originWall + self.start - origin) / 1000.0,
+            "dur": (end - self.start) / 1000.0,
+            "pid": os.getpid(),
+            "tid": laneId(),
+            "args": args,
+        }
+        with lock:
+            events.append(event)
+        return False
+
+
+class NoSpan():
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+noSpan = NoSpan()
+
+
+def span(name, **attrs):
+    return Span(name, attrs) if enabled else noSpan
+
+
+def export(path, extra_events=()):
+    with lock:
+        trace_events = list(events)
+    trace_events.extend(extra_events)
+    from TileBuilderMonitor_cache import writeAtomic   # the cache module imports this one
+    writeAtomic(path, lambda file: json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, file))
+    return trace_events
+
+
+def readEvents(path):
+    # traceEvents of an exported trace , [] if there isn't one
+    try:
+        with open(path, 'r') as file:
+            return json.load(file).get("traceEvents", [])
+    except (OSError, json.JSONDecodeError, AttributeError):
+        return []
+
+
+def percentile(values, pct):
+    # nearest rank on sorted values
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(pct / 100.0 * len(values)) - 1)]
+
+
+def summary(trace_events=None, top=10):
+    if trace_events is None:
+        with lock:
+            trace_events = list(events)
+    stages = defaultdict(list)
+    servers = defaultdict(list)
+    for event in trace_events:
+        stages[event["name"]].append(event["dur"] / 1000.0)
+        server = event.get("args", {}).get("server")
+        if server:
+            servers[(event["name"], server)].append(event["dur"] / 1000.0)
+
+    def row(label, durations):
+        durations.sort()
+        return (f"{label:48.48} {len(durations):7d} {sum(durations) / 1000.0:9.2f} {percentile(durations, 50):9.1f} "
+                f"{percentile(durations, 90):9.1f} {percentile(durations, 99):9.1f} {durations[-1]:9.1f}")
+
+    def header(label):
+        return f"{label:48} {'count':>7} {'total s':>9} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+
+    lines = [header("stage")]
+    for name in sorted(stages, key=lambda n: sum(stages[n]), reverse=True):
+        lines.append(row(name, stages[name]))
+    if servers:
+        lines.append("")
+        lines.append(f"slowest servers (by p90 , top {top})")
+        lines.append(header("stage @ server"))
+        ranked = sorted(servers, key=lambda key: percentile(sorted(servers[key]), 90), reverse=True)[:top]
+        for name, server in ranked:
+            lines.append(row(f"{name} @ {server}", servers[(name, server)]))
+    return "\n".join(lines)
+
+
+def write(out_dir, extra_events=()):
+    # trace.json and trace_summary.txt in out_dir , returns the summary text
+    trace_events = export(os.path.join(out_dir, traceName), extra_events)
+    text = summary(trace_events)
+    with open(os.path.join(out_dir, summaryName), 'w') as file:
+        file.write(text + "\n")
+    return text